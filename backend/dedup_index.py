@@ -0,0 +1,155 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+MINHASH_PERMUTATIONS = 128  # Signature length for Jaccard deduplication
+MINHASH_SEED = 20240601
+MAX_MISS_RATE = 0.001  # Chance that LSH misses a pair exactly at the similarity threshold
+LINEAR_SCAN_LIMIT = 64  # Below this many routes a plain scan beats the LSH lookup
+
+
+class CentroidIndex:
+    """
+    Uniform grid over accepted route centroids for centroid deduplication.
+
+    Centroids are projected to local metres (equirectangular about the first
+    centroid's latitude, so longitude is scaled by cos(lat); the error is
+    well under a metre across a search area) and bucketed into square cells
+    min_dist_m wide. Any centroid closer than min_dist_m lies in one of the
+    3x3 cells around a query, so a check costs the same however many
+    centroids have been accepted.
+    """
+    __slots__ = ['min_dist_m', '_cells', '_lat0', '_m_per_deg_lng', '_size']
+
+    def __init__(self, min_dist_m: float):
+        self.min_dist_m = min_dist_m
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float]]] = {}
+        self._lat0 = None
+        self._m_per_deg_lng = METERS_PER_DEGREE
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _project(self, lat: float, lng: float) -> Tuple[float, float]:
+        if self._lat0 is None:
+            self._lat0 = lat
+            self._m_per_deg_lng = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        return lng * self._m_per_deg_lng, (lat - self._lat0) * METERS_PER_DEGREE
+
+    def too_close(self, centroid: Optional[Tuple[float, float]]) -> bool:
+        """True if an accepted centroid lies within min_dist_m of centroid."""
+        if not centroid or not self._size or self.min_dist_m <= 0:
+            return False
+        x, y = self._project(*centroid)
+        cx, cy = math.floor(x / self.min_dist_m), math.floor(y / self.min_dist_m)
+        threshold_sq = self.min_dist_m * self.min_dist_m
+        cells = self._cells
+        for i in (cx - 1, cx, cx + 1):
+            for j in (cy - 1, cy, cy + 1):
+                for px, py in cells.get((i, j), ()):
+                    dx = x - px
+                    dy = y - py
+                    if dx * dx + dy * dy < threshold_sq:
+                        return True
+        return False
+
+    def add(self, centroid: Tuple[float, float]):
+        x, y = self._project(*centroid)
+        cell_m = self.min_dist_m if self.min_dist_m > 0 else 1.0
+        key = (math.floor(x / cell_m), math.floor(y / cell_m))
+        bucket = self._cells.get(key)
+        if bucket is None:
+            bucket = self._cells[key] = []
+        bucket.append((x, y))
+        self._size += 1
+
+
+def _band_rows(threshold: float, num_perm: int) -> int:
+    """
+    Widest LSH band whose chance of missing a pair at threshold similarity
+    stays under MAX_MISS_RATE. A pair with Jaccard similarity s shares at
+    least one of num_perm // rows bands with probability
+    1 - (1 - s**rows) ** (num_perm // rows); wider bands mean fewer
+    dissimilar pairs on the shortlist.
+    """
+    for rows in range(num_perm, 1, -1):
+        if (1 - threshold ** rows) ** (num_perm // rows) < MAX_MISS_RATE:
+            return rows
+    return 1
+
+
+class MinHashIndex:
+    """
+    LSH index over MinHash signatures of accepted routes' node sets, for
+    Jaccard deduplication.
+
+    A signature holds, for each of num_perm multiply-shift hash functions,
+    the minimum hash over the route's nodes; two routes agree on each entry
+    with probability equal to their Jaccard similarity. Signatures are cut
+    into bands, each folded into one integer key, so a lookup only
+    shortlists routes sharing a whole band. The shortlist is then checked
+    exactly on the visited masks, so the index never rejects a route that
+    is not similar; it can (with probability under MAX_MISS_RATE at the
+    threshold, falling quickly above it) miss one that is. Below
+    LINEAR_SCAN_LIMIT routes, lookups just compare every mask.
+    """
+    __slots__ = ['threshold', 'num_perm', 'rows', '_a', '_b', '_mix', '_masks', '_bands']
+
+    def __init__(self, threshold: float, num_perm: int = MINHASH_PERMUTATIONS, seed: int = MINHASH_SEED):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.rows = _band_rows(threshold, num_perm) if 0 < threshold < 1 else 1
+        rng = np.random.default_rng(seed)
+        # Odd 64-bit multipliers for the hash functions and for folding a band into its key
+        self._a = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self._mix = rng.integers(0, 2 ** 63, size=self.rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._masks: List[int] = []
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(num_perm // self.rows)]
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    def _band_keys(self, nodes: Sequence[int]) -> List[int]:
+        """MinHash signature of a route's node set, folded to one key per band."""
+        x = np.asarray(nodes, dtype=np.uint64)
+        num_bands = len(self._bands)
+        with np.errstate(over='ignore'):  # Multiply-shift hashing relies on wraparound
+            signature = ((self._a[:, None] * x[None, :] + self._b[:, None]) >> np.uint64(32)).min(axis=1)
+            bands = signature[:num_bands * self.rows].reshape(num_bands, self.rows)
+            return (bands * self._mix).sum(axis=1).tolist()
+
+    def is_unique(self, mask: int, nodes: Sequence[int]) -> bool:
+        """True unless an indexed route's Jaccard similarity with mask (the bitmask of nodes) exceeds the threshold."""
+        if len(self._masks) < LINEAR_SCAN_LIMIT or self.threshold <= 0:
+            # Small index, or any shared node counts (LSH only finds substantial overlaps)
+            shortlist = range(len(self._masks))
+        else:
+            shortlist = set()
+            for band, key in zip(self._bands, self._band_keys(nodes)):
+                entries = band.get(key)
+                if entries:
+                    shortlist.update(entries)
+
+        count = mask.bit_count()
+        masks = self._masks
+        threshold = self.threshold
+        for i in shortlist:
+            existing = masks[i]
+            intersection = (mask & existing).bit_count()
+            union = count + existing.bit_count() - intersection
+            if union > 0 and intersection / union > threshold:
+                return False
+        return True
+
+    def add(self, mask: int, nodes: Sequence[int]):
+        i = len(self._masks)
+        self._masks.append(mask)
+        for band, key in zip(self._bands, self._band_keys(nodes)):
+            entries = band.get(key)
+            if entries is None:
+                entries = band[key] = []
+            entries.append(i)
@@ -0,0 +1,162 @@
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+import numpy as np
+import srtm
+
+# Configuration
+DEM_TILE_DIR = None  # Directory of unzipped .hgt tiles; None uses the srtm.py download cache
+MIN_VALID_ELEVATION_M = -1000  # SRTM voids are stored as -32768
+MAX_VALID_ELEVATION_M = 10000
+TILE_RETRY_S = 300  # A tile that failed to load (network, bad file) is retried after this long
+
+
+class DEMUnavailableError(RuntimeError):
+    """A DEM tile that should exist could not be loaded."""
+
+
+def tile_name(lat0: int, lng0: int) -> str:
+    """SRTM tile name for the 1x1 degree cell whose south-west corner is (lat0, lng0), e.g. N35W083.hgt."""
+    return '%s%02d%s%03d.hgt' % ('N' if lat0 >= 0 else 'S', abs(lat0), 'E' if lng0 >= 0 else 'W', abs(lng0))
+
+
+class DEM:
+    """
+    In-memory SRTM elevation model answering whole coordinate arrays at once.
+
+    Tiles are 1x1 degree int16 rasters (3601 or 1201 samples square, rows
+    running north to south, edges shared with the neighbouring tiles). They
+    are loaded on first use: memory-mapped from tile_dir when the .hgt file
+    is there, otherwise fetched through srtm.py, which downloads and caches
+    them. Elevations are bilinear-interpolated between the four surrounding
+    samples; voids, missing tiles and ocean come back as NaN.
+
+    Only tiles SRTM genuinely lacks are remembered as missing. A tile that
+    failed to load also reads as NaN, but is retried after TILE_RETRY_S,
+    and preload(strict=True) raises for it.
+    """
+
+    def __init__(self, tile_dir: Optional[str] = None, mmap: bool = True):
+        self.tile_dir = tile_dir
+        self.mmap = mmap
+        self._tiles: Dict[Tuple[int, int], Optional[np.ndarray]] = {}
+        self._failed: Dict[Tuple[int, int], float] = {}  # Tile -> time.monotonic() of its last failed load
+        self._srtm = None
+        self._lock = threading.Lock()
+
+    def preload(self, south: float, west: float, north: float, east: float, strict: bool = False) -> int:
+        """
+        Loads every tile intersecting the bounding box; returns how many are
+        available. With strict, raises DEMUnavailableError if any of them
+        failed to load, rather than being absent from SRTM.
+        """
+        available = 0
+        failed = []
+        for lat0 in range(math.floor(south), math.floor(north) + 1):
+            for lng0 in range(math.floor(west), math.floor(east) + 1):
+                if self._tile(lat0, lng0) is not None:
+                    available += 1
+                elif (lat0, lng0) in self._failed:
+                    failed.append(tile_name(lat0, lng0))
+        if strict and failed:
+            raise DEMUnavailableError(f"SRTM tiles failed to load: {', '.join(failed)}")
+        return available
+
+    def elevations(self, lat, lng) -> np.ndarray:
+        """Elevation in metres (float64, NaN where unknown) for arrays of coordinates."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        result = np.full(lat.shape, np.nan)
+        lat0 = np.floor(lat).astype(np.int64)
+        lng0 = np.floor(lng).astype(np.int64)
+        # Group points by tile; routes rarely touch more than one
+        keys = lat0 * 1000 + lng0
+        for key in np.unique(keys).tolist():
+            tile_lat0, tile_lng0 = (key + 500) // 1000, (key + 500) % 1000 - 500
+            tile = self._tile(tile_lat0, tile_lng0)
+            if tile is None:
+                continue
+            idx = np.flatnonzero(keys == key)
+            result[idx] = self._bilinear(tile, tile_lat0, tile_lng0, lat[idx], lng[idx])
+        return result
+
+    def elevation(self, lat: float, lng: float) -> Optional[float]:
+        """Single-point convenience wrapper; None where unknown."""
+        value = float(self.elevations([lat], [lng])[0])
+        return None if math.isnan(value) else value
+
+    @staticmethod
+    def _bilinear(tile: np.ndarray, lat0: int, lng0: int, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+        side = tile.shape[0] - 1
+        row = (lat0 + 1 - lat) * side
+        col = (lng - lng0) * side
+        r0 = np.clip(np.floor(row).astype(np.int64), 0, side - 1)
+        c0 = np.clip(np.floor(col).astype(np.int64), 0, side - 1)
+        fr = row - r0
+        fc = col - c0
+        z00 = tile[r0, c0].astype(np.float64)
+        z01 = tile[r0, c0 + 1].astype(np.float64)
+        z10 = tile[r0 + 1, c0].astype(np.float64)
+        z11 = tile[r0 + 1, c0 + 1].astype(np.float64)
+        z = (1 - fr) * ((1 - fc) * z00 + fc * z01) + fr * ((1 - fc) * z10 + fc * z11)
+        corners = np.stack([z00, z01, z10, z11])
+        void = ((corners < MIN_VALID_ELEVATION_M) | (corners > MAX_VALID_ELEVATION_M)).any(axis=0)
+        z[void] = np.nan
+        return z
+
+    def _tile(self, lat0: int, lng0: int) -> Optional[np.ndarray]:
+        key = (lat0, lng0)
+        if key in self._tiles:
+            return self._tiles[key]
+        with self._lock:
+            if key in self._tiles:
+                return self._tiles[key]
+            failed_at = self._failed.get(key)
+            if failed_at is not None and time.monotonic() - failed_at < TILE_RETRY_S:
+                return None
+            try:
+                tile = self._load_tile(lat0, lng0)
+            except Exception as e:
+                print(f"Warning: SRTM tile {tile_name(lat0, lng0)} unavailable: {e}")
+                self._failed[key] = time.monotonic()
+                return None
+            self._failed.pop(key, None)
+            self._tiles[key] = tile
+            return tile
+
+    def _load_tile(self, lat0: int, lng0: int) -> Optional[np.ndarray]:
+        """Reads a tile; None if SRTM has none there. Raises if it can't be fetched or read."""
+        name = tile_name(lat0, lng0)
+        path = os.path.join(self.tile_dir, name) if self.tile_dir else None
+        if path and os.path.exists(path):
+            side = int(math.isqrt(os.path.getsize(path) // 2))
+            if self.mmap:
+                return np.memmap(path, dtype='>i2', mode='r', shape=(side, side))
+            return np.fromfile(path, dtype='>i2').reshape(side, side)
+
+        if self._srtm is None:
+            self._srtm = srtm.get_data()
+        data = self._srtm.retrieve_or_load_file_data(name)  # None where SRTM has no tile (e.g. open ocean)
+        if not data:
+            return None
+        side = int(math.isqrt(len(data) // 2))
+        return np.frombuffer(data, dtype='>i2').reshape(side, side)
+
+
+_default_dem = None
+_default_dem_lock = threading.Lock()
+
+
+def get_dem() -> DEM:
+    """Returns the process-wide DEM (tiles in DEM_TILE_DIR or the srtm.py cache)."""
+    global _default_dem
+    with _default_dem_lock:
+        if _default_dem is None:
+            tile_dir = DEM_TILE_DIR
+            if tile_dir is None:
+                # srtm.py keeps unzipped tiles here, so they can be memory-mapped directly
+                tile_dir = os.path.join(os.path.expanduser('~'), '.cache', 'srtm')
+            _default_dem = DEM(tile_dir)
+        return _default_dem
@@ -0,0 +1,106 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import shapely
+from dedup_index import METERS_PER_DEGREE
+from edge_samples import edge_vertices
+from graph_snapshot import GraphSnapshot
+
+COORDINATE_DECIMALS = 6  # About 0.1 m; GeoJSON output is rounded to this
+SUMMARY_TOLERANCE_M = 10.0  # Simplification of route summary geometry
+
+
+class EdgeGeometry:
+    """
+    Route geometry as GeoJSON text fragments per snapshot edge slot, so a
+    route's LineString is a string join instead of shapely merging and
+    float formatting per path.
+
+    Each slot is one direction of travel (a two-way street has a slot each
+    way), oriented from its source node; its vertices are rows
+    vertex_start[e]:vertex_start[e + 1] of vertex_x, vertex_y (which may be
+    memory-mapped, see graph_store). A slot is encoded the first time a
+    route uses it, then kept: a head, its first vertex as '[lng,lat]', and
+    a tail, the rest as ',[lng,lat],...', with coordinates rounded to
+    decimals. Consecutive edges of a route share a node, so a route is the
+    first edge's head followed by every edge's tail.
+    """
+
+    def __init__(self, snapshot: GraphSnapshot, vertex_start, vertex_x, vertex_y,
+                 decimals: int = COORDINATE_DECIMALS):
+        self.snapshot = snapshot
+        self.vertex_start = vertex_start
+        self.vertex_x = vertex_x
+        self.vertex_y = vertex_y
+        self.decimals = decimals
+        self._fragments: Dict[int, Tuple[str, str]] = {}
+        self._encoded_chars = 0
+
+    @classmethod
+    def from_graph(cls, G, snapshot: GraphSnapshot, decimals: int = COORDINATE_DECIMALS) -> 'EdgeGeometry':
+        """Geometry of every snapshot edge of G (see edge_samples.edge_vertices)."""
+        pt_start, _, pt_x, pt_y = edge_vertices(G, snapshot)
+        return cls(snapshot, pt_start, pt_x, pt_y, decimals)
+
+    @property
+    def encoded_chars(self) -> int:
+        """Length of the fragment text encoded so far."""
+        return self._encoded_chars
+
+    def _quantize(self, rows) -> Tuple[np.ndarray, np.ndarray]:
+        scale = 10 ** self.decimals
+        return (np.round(self.vertex_x[rows] * scale).astype(np.int64),
+                np.round(self.vertex_y[rows] * scale).astype(np.int64))
+
+    def _vertex_text(self, qx: np.ndarray, qy: np.ndarray) -> List[str]:
+        # Python's float repr is what json.dumps writes, so the text matches a normal encode
+        scale = 10 ** self.decimals
+        return [f'[{x!r},{y!r}]' for x, y in zip((qx / scale).tolist(), (qy / scale).tolist())]
+
+    def _fragment(self, e: int) -> Tuple[str, str]:
+        fragment = self._fragments.get(e)
+        if fragment is None:
+            first, end = int(self.vertex_start[e]), int(self.vertex_start[e + 1])
+            vertices = self._vertex_text(*self._quantize(slice(first, end)))
+            fragment = (vertices[0], ''.join([',' + vertex for vertex in vertices[1:]])) if vertices else ('', '')
+            self._fragments[e] = fragment
+            self._encoded_chars += len(fragment[0]) + len(fragment[1])
+        return fragment
+
+    def linestring_json(self, path: List[int], tolerance_m: float = 0.0) -> Optional[str]:
+        """
+        GeoJSON LineString text of a node path, or None if it has no edges.
+        With tolerance_m, the line is simplified (see path_coordinates).
+        """
+        if tolerance_m > 0:
+            qx, qy = self.path_coordinates(path, tolerance_m)
+            if not len(qx):
+                return None
+            return '{"type":"LineString","coordinates":[' + ','.join(self._vertex_text(qx, qy)) + ']}'
+
+        edges = self.snapshot.path_edges(path)
+        if not edges:
+            return None
+        fragment = self._fragment
+        return '{"type":"LineString","coordinates":[' + fragment(edges[0])[0] + ''.join([fragment(e)[1] for e in edges]) + ']}'
+
+    def path_coordinates(self, path: List[int], tolerance_m: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Quantized (qx, qy) vertices of a node path's LineString, as in
+        linestring_json. With tolerance_m, Douglas-Peucker simplified so no
+        vertex strays further than that from the line (measured in degrees
+        of latitude, which is conservative across longitude).
+        """
+        edges = np.asarray(self.snapshot.path_edges(path), dtype=np.int64)
+        if not len(edges):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # Every edge after the first starts at the previous one's last vertex
+        starts = self.vertex_start[edges] + (np.arange(len(edges)) > 0)
+        counts = self.vertex_start[edges + 1] - starts
+        rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()), dtype=np.int64)
+        qx, qy = self._quantize(rows)
+        if tolerance_m > 0 and len(qx) > 2:
+            tolerance = tolerance_m / METERS_PER_DEGREE * 10 ** self.decimals
+            line = shapely.simplify(shapely.linestrings(qx, qy), tolerance, preserve_topology=False)
+            simplified = shapely.get_coordinates(line).astype(np.int64)
+            qx, qy = simplified[:, 0], simplified[:, 1]
+        return qx, qy
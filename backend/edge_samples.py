@@ -0,0 +1,200 @@
+from typing import List, Optional, Tuple
+import numpy as np
+import shapely
+from pyproj import Geod
+from graph_snapshot import GraphSnapshot
+
+SAMPLE_INTERVAL_M = 50  # Spacing of precomputed route samples
+MIN_EDGE_LENGTH_M = 1.0  # Shorter edges contribute no samples (and no distance)
+
+_geod = Geod(ellps='WGS84')
+
+
+def edge_vertices(G, snapshot: GraphSnapshot) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Polyline vertices of every snapshot edge slot, as (pt_start, pt_edge,
+    pt_x, pt_y): edge e's vertices are rows pt_start[e]:pt_start[e + 1],
+    oriented from its source node. Edge geometry is the 'geometry'
+    attribute of the same parallel edge the snapshot reads, or a straight
+    line between the end nodes.
+    """
+    num_edges = snapshot.num_edges
+    sources = np.repeat(np.arange(snapshot.num_nodes, dtype=np.int64), np.diff(snapshot.offsets))
+    targets = snapshot.targets
+
+    # Polyline vertices of all edges, grouped by edge slot
+    geom_edges, geoms = [], []
+    for e, (u, v) in enumerate(zip(sources.tolist(), targets.tolist())):
+        edges = G[u][v]
+        data = edges[0] if 0 in edges else next(iter(edges.values()))
+        if 'geometry' in data:
+            geom_edges.append(e)
+            geoms.append(data['geometry'])
+    has_geom = np.zeros(num_edges, dtype=bool)
+    has_geom[geom_edges] = True
+    straight = np.flatnonzero(~has_geom)
+
+    geom_xy, geom_index = shapely.get_coordinates(np.array(geoms, dtype=object), return_index=True)
+    pt_edge = np.concatenate([np.asarray(geom_edges, dtype=np.int64)[geom_index], np.repeat(straight, 2)])
+    pt_x = np.concatenate([geom_xy[:, 0], np.stack([snapshot.node_x[sources[straight]], snapshot.node_x[targets[straight]]], axis=1).ravel()])
+    pt_y = np.concatenate([geom_xy[:, 1], np.stack([snapshot.node_y[sources[straight]], snapshot.node_y[targets[straight]]], axis=1).ravel()])
+    order = np.argsort(pt_edge, kind='stable')
+    pt_edge, pt_x, pt_y = pt_edge[order], pt_x[order], pt_y[order]
+    pt_start = np.zeros(num_edges + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pt_edge, minlength=num_edges), out=pt_start[1:])
+
+    # Older graphs store some geometries against the edge direction; orient each from its source node
+    first_x, first_y = pt_x[pt_start[:-1]], pt_y[pt_start[:-1]]
+    to_source = np.hypot(first_x - snapshot.node_x[sources], first_y - snapshot.node_y[sources])
+    to_target = np.hypot(first_x - snapshot.node_x[targets], first_y - snapshot.node_y[targets])
+    flip = to_target < to_source
+    vertex = np.arange(len(pt_edge), dtype=np.int64)
+    vertex = np.where(flip[pt_edge], pt_start[pt_edge] + pt_start[pt_edge + 1] - 1 - vertex, vertex)
+    pt_x, pt_y = pt_x[vertex], pt_y[vertex]
+    return pt_start, pt_edge, pt_x, pt_y
+
+
+class EdgeSamples:
+    """
+    Route sample points precomputed for every snapshot edge slot, so sampling
+    a route is a concatenation instead of per-edge geodesic and shapely work.
+
+    Edge e's samples are rows offsets[e]:offsets[e + 1] of dist (metres from
+    the start of the edge), lat, lng and bearing, taken at num_samples =
+    max(2, int(length / interval_m) + 1) evenly spaced fractions of the edge
+    geometry, including both ends. lengths[e] is the geodesic length of the
+    edge; edges shorter than MIN_EDGE_LENGTH_M have no samples and length 0.
+
+    Per-edge route statistics are kept alongside, so a route's totals are
+    sums over its edges: climb[e] and descent[e] (metres, from DEM
+    elevations at the samples; 0 without a DEM) and lat_sum[e], lng_sum[e],
+    the geometry's coordinates integrated over its length (length times the
+    length-weighted mean coordinate).
+    """
+
+    def __init__(self, snapshot: GraphSnapshot, interval_m: float, offsets, dist, lat, lng, bearing, lengths,
+                 climb, descent, lat_sum, lng_sum):
+        self.snapshot = snapshot
+        self.interval_m = interval_m
+        self.offsets = offsets
+        self.dist = dist
+        self.lat = lat
+        self.lng = lng
+        self.bearing = bearing
+        self.lengths = lengths
+        self.climb = climb
+        self.descent = descent
+        self.lat_sum = lat_sum
+        self.lng_sum = lng_sum
+
+    @property
+    def num_samples(self) -> int:
+        return len(self.dist)
+
+    @classmethod
+    def from_graph(cls, G, snapshot: GraphSnapshot, interval_m: float = SAMPLE_INTERVAL_M, dem=None) -> 'EdgeSamples':
+        """
+        Samples every snapshot edge of G (see edge_vertices) in one vectorized
+        pass. Climb and descent are read from dem (a dem.DEM) when given.
+        """
+        pt_start, _, pt_x, pt_y = edge_vertices(G, snapshot)
+        return cls.from_vertices(snapshot, pt_start, pt_x, pt_y, interval_m, dem)
+
+    @classmethod
+    def from_vertices(cls, snapshot: GraphSnapshot, pt_start, pt_x, pt_y, interval_m: float = SAMPLE_INTERVAL_M,
+                      dem=None) -> 'EdgeSamples':
+        """from_graph for edge polylines already laid out as edge_vertices returns them."""
+        num_edges = snapshot.num_edges
+        pt_edge = np.repeat(np.arange(num_edges, dtype=np.int64), np.diff(pt_start))
+
+        # Per-segment geodesic (for length) and planar (for shapely-style interpolation) lengths;
+        # seg_* [i] is the segment ending at vertex i, 0 at the first vertex of each edge
+        first_vertex = np.zeros(len(pt_edge), dtype=bool)
+        first_vertex[pt_start[:-1][np.diff(pt_start) > 0]] = True
+        _, _, seg_geo = _geod.inv(np.roll(pt_x, 1), np.roll(pt_y, 1), pt_x, pt_y)
+        seg_geo = np.where(first_vertex, 0.0, seg_geo)
+        seg_planar = np.where(first_vertex, 0.0, np.hypot(pt_x - np.roll(pt_x, 1), pt_y - np.roll(pt_y, 1)))
+        lengths = np.bincount(pt_edge, weights=seg_geo, minlength=num_edges)
+        lat_sum = np.bincount(pt_edge, weights=seg_geo * (pt_y + np.roll(pt_y, 1)) / 2, minlength=num_edges)
+        lng_sum = np.bincount(pt_edge, weights=seg_geo * (pt_x + np.roll(pt_x, 1)) / 2, minlength=num_edges)
+        cum_planar = np.cumsum(seg_planar)
+        edge_planar = np.bincount(pt_edge, weights=seg_planar, minlength=num_edges)
+        too_short = lengths < MIN_EDGE_LENGTH_M
+        lengths[too_short] = lat_sum[too_short] = lng_sum[too_short] = 0.0
+
+        counts = np.where(lengths > 0, np.maximum(2, (lengths / interval_m).astype(np.int64) + 1), 0)
+        offsets = np.zeros(num_edges + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        sample_edge = np.repeat(np.arange(num_edges, dtype=np.int64), counts)
+        j = np.arange(offsets[-1], dtype=np.int64) - offsets[sample_edge]
+        frac = j / (counts[sample_edge] - 1)
+
+        lng, lat = cls._interpolate(frac, sample_edge, pt_start, pt_x, pt_y, cum_planar, edge_planar)
+        # Bearing towards a point 1% further along (none within the last 0.01%)
+        epsilon = np.minimum(0.01, 1.0 - frac)
+        ahead_lng, ahead_lat = cls._interpolate(frac + epsilon, sample_edge, pt_start, pt_x, pt_y, cum_planar, edge_planar)
+        fwd_az, _, _ = _geod.inv(lng, lat, ahead_lng, ahead_lat)
+        bearing = np.where(epsilon > 0.0001, np.round(np.mod(fwd_az, 360), 1), 0.0)
+
+        dist = frac * lengths[sample_edge]
+
+        # Climb and descent between consecutive samples of the same edge; unknown elevations count as flat
+        climb = np.zeros(num_edges)
+        descent = np.zeros(num_edges)
+        if dem is not None and len(sample_edge) > 1:
+            rise = np.nan_to_num(np.diff(dem.elevations(lat, lng)))
+            same_edge = sample_edge[1:] == sample_edge[:-1]
+            rise_edge = sample_edge[1:][same_edge]
+            rise = rise[same_edge]
+            climb = np.bincount(rise_edge, weights=np.maximum(rise, 0.0), minlength=num_edges)
+            descent = np.bincount(rise_edge, weights=np.maximum(-rise, 0.0), minlength=num_edges)
+        return cls(snapshot, interval_m, offsets, dist, lat, lng, bearing, lengths, climb, descent, lat_sum, lng_sum)
+
+    @staticmethod
+    def _interpolate(frac, sample_edge, pt_start, pt_x, pt_y, cum_planar, edge_planar):
+        """Points at normalized planar fractions along each sample's edge polyline (shapely.interpolate semantics)."""
+        first = pt_start[sample_edge]
+        last = pt_start[sample_edge + 1] - 1
+        target = cum_planar[first] + np.clip(frac, 0.0, 1.0) * edge_planar[sample_edge]
+        # Segment k -> k+1 containing the target, kept inside the edge's own vertices
+        k = np.clip(np.searchsorted(cum_planar, target, side='right') - 1, first, np.maximum(last - 1, first))
+        k_next = np.minimum(k + 1, last)
+        seg = cum_planar[k_next] - cum_planar[k]
+        ratio = np.divide(target - cum_planar[k], seg, out=np.zeros_like(seg), where=seg > 0)
+        ratio = np.clip(ratio, 0.0, 1.0)
+        x = pt_x[k] + ratio * (pt_x[k_next] - pt_x[k])
+        y = pt_y[k] + ratio * (pt_y[k_next] - pt_y[k])
+        return x, y
+
+    def path_edges(self, path: List[int]) -> List[int]:
+        """Edge slots traversed by a node path; steps with no edge are skipped."""
+        return self.snapshot.path_edges(path)
+
+    def path_stats(self, path: List[int]) -> Tuple[float, float, float, Optional[Tuple[float, float]]]:
+        """
+        Returns (length_m, climb_m, descent_m, centroid) of a node path from
+        the per-edge sums, where centroid is the length-weighted mean
+        (lat, lng) of the route geometry, or None for an empty route.
+        """
+        edges = np.asarray(self.path_edges(path), dtype=np.int64)
+        length = float(self.lengths[edges].sum())
+        centroid = None
+        if length > 0:
+            centroid = (float(self.lat_sum[edges].sum()) / length, float(self.lng_sum[edges].sum()) / length)
+        return length, float(self.climb[edges].sum()), float(self.descent[edges].sum()), centroid
+
+    def sample_path(self, path: List[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns (dist_m, lat, lng, bearing) arrays for the whole route, with
+        dist measured from the route start. Consecutive edges share an end
+        point, which appears twice.
+        """
+        edges = np.asarray(self.path_edges(path), dtype=np.int64)
+        starts = self.offsets[edges]
+        counts = self.offsets[edges + 1] - starts
+        # Row indices of every sample, edge by edge
+        rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(int(counts.sum()), dtype=np.int64)
+        edge_start_m = np.zeros(len(edges))
+        np.cumsum(self.lengths[edges][:-1], out=edge_start_m[1:])
+        dist = np.repeat(edge_start_m, counts) + self.dist[rows]
+        return dist, self.lat[rows], self.lng[rows], self.bearing[rows]
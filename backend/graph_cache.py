@@ -0,0 +1,174 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+import numpy as np
+from edge_geometry import EdgeGeometry
+from edge_samples import EdgeSamples
+from graph_snapshot import GraphSnapshot
+from graph_store import GraphStore
+
+DEFAULT_BUDGET_BYTES = 2 * 1024 ** 3
+# Cost of a built NetworkX graph, fitted to its resident-memory growth on the test_playground graphs:
+# attribute dicts and a GEOS LineString per edge, plus the LineString coordinates per geometry vertex
+NETWORKX_BYTES_PER_EDGE = 1100
+NETWORKX_BYTES_PER_VERTEX = 64
+
+
+def _array_bytes(obj) -> int:
+    """Bytes of the in-memory (not memory-mapped) NumPy arrays among obj's attributes."""
+    return sum(value.nbytes for value in vars(obj).values()
+               if isinstance(value, np.ndarray) and not isinstance(value, np.memmap))
+
+
+class LoadedGraph:
+    """
+    A graph held by GraphCache: its store and everything derived from it
+    that the server reads. Other per-graph indexes (spatial lookups) are
+    built on first use through index() and cached with the graph. pins
+    counts the open GraphHandles on it; a pinned graph is never evicted.
+    """
+
+    def __init__(self, name: str, store: GraphStore, snapshot: GraphSnapshot, edge_samples: EdgeSamples,
+                 edge_geometry: EdgeGeometry):
+        self.name = name
+        self.store = store
+        self.snapshot = snapshot
+        self.edge_samples = edge_samples
+        self.edge_geometry = edge_geometry
+        self.pins = 0
+        self._indexes: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def index(self, key: str, build: Callable[['LoadedGraph'], Any]) -> Any:
+        """The index stored under key, built by build(self) the first time it is asked for."""
+        index = self._indexes.get(key)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    index = self._indexes[key] = build(self)
+        return index
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory held: the mapped store arrays, arrays rebuilt in
+        memory, encoded geometry, indexes (their nbytes, where they report
+        one) and, once built, the snapshot's adjacency lists and the
+        NetworkX graph. Read live, so lazily built parts count from the next
+        eviction check on.
+        """
+        total = self.store.nbytes + _array_bytes(self.snapshot) + _array_bytes(self.edge_samples)
+        total += self.snapshot.list_nbytes
+        total += self.edge_geometry.encoded_chars
+        total += sum(getattr(index, 'nbytes', 0) for index in list(self._indexes.values()))
+        if self.store.graph_built:
+            total += (NETWORKX_BYTES_PER_EDGE * self.snapshot.num_edges
+                      + NETWORKX_BYTES_PER_VERTEX * len(self.edge_geometry.vertex_x))
+        return total
+
+
+class GraphHandle:
+    """
+    A counted reference to a cached graph, which stays pinned until every
+    handle on it is released. Each connection holds a handle on the graph
+    it works on, and each search its own, so one client switching graphs
+    never changes the graph of another client or of a running search.
+    """
+
+    def __init__(self, cache: 'GraphCache', graph: LoadedGraph):
+        self._cache = cache
+        self.graph = graph
+        self._released = False
+        cache.pin(graph)
+
+    @property
+    def name(self) -> str:
+        return self.graph.name
+
+    def acquire(self) -> 'GraphHandle':
+        """Another handle on the same graph, released independently of this one."""
+        return GraphHandle(self._cache, self.graph)
+
+    def release(self):
+        """Drops this reference; releasing twice is a no-op."""
+        if not self._released:
+            self._released = True
+            self._cache.unpin(self.graph)
+
+
+class GraphCache:
+    """
+    Loaded graphs by key (their store path), least recently used first.
+    Once their estimated total size passes budget_bytes, unpinned graphs are
+    evicted oldest first; the graph just used is always kept, even when it
+    alone is over budget. Evicted graphs stay alive for as long as anything
+    still references them (a running search, the path set cache).
+    """
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._graphs: 'OrderedDict[str, LoadedGraph]' = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._graphs
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(graph.nbytes for graph in self._graphs.values())
+
+    def names(self) -> List[str]:
+        """Names of the cached graphs, least recently used first."""
+        with self._lock:
+            return [graph.name for graph in self._graphs.values()]
+
+    def get(self, key: str, load: Callable[[], LoadedGraph]) -> LoadedGraph:
+        """The graph cached under key, loaded with load() on a miss; marks it most recently used."""
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                graph = self._graphs[key] = load()
+            self._graphs.move_to_end(key)
+            self.evict()
+            return graph
+
+    def open(self, key: str, load: Callable[[], LoadedGraph]) -> GraphHandle:
+        """A handle on the graph under key (see get)."""
+        with self._lock:
+            return GraphHandle(self, self.get(key, load))
+
+    def discard(self, key: str):
+        """Forgets the graph under key (its files changed); users holding it keep their copy."""
+        with self._lock:
+            self._graphs.pop(key, None)
+
+    def pin(self, graph: LoadedGraph):
+        with self._lock:
+            graph.pins += 1
+
+    def unpin(self, graph: LoadedGraph):
+        with self._lock:
+            graph.pins -= 1
+            self.evict()
+
+    def evict(self) -> int:
+        """Evicts unpinned graphs, least recently used first, until within budget; returns how many."""
+        evicted = 0
+        with self._lock:
+            total = self.nbytes
+            for key in list(self._graphs)[:-1]:
+                if total <= self.budget_bytes:
+                    break
+                graph = self._graphs[key]
+                if graph.pins > 0:
+                    continue
+                total -= graph.nbytes
+                del self._graphs[key]
+                evicted += 1
+                print(f"Evicted graph {graph.name} from the cache")
+        return evicted
@@ -1,74 +1,99 @@
-import pickle
 import os
 import json
 import math
+import heapq
 import osmnx as ox
 import networkx as nx
-from shapely.geometry import Polygon, Point, LineString, MultiLineString, mapping
-import geopandas as gpd
-import srtm
+from shapely.geometry import Polygon, Point, LineString
+import numpy as np
+from dem import get_dem
+from graph_cache import GraphCache, GraphHandle, LoadedGraph
+from graph_store import STORE_SUFFIX, GraphStore, convert_gpickle, write_store
+from node_index import NodeIndex
+
+NODE_INDEX = 'nodes'  # LoadedGraph.index key of the NodeIndex
 
 class GraphManager:
     _instance = None
-    _graph = None
-    _active_name = None
+    _cache = None
     _graphs_dir = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(GraphManager, cls).__new__(cls)
+            cls._instance._cache = GraphCache()
         return cls._instance
 
     def set_graphs_dir(self, graphs_dir: str):
         """Sets the directory containing graph files."""
         self._graphs_dir = graphs_dir
 
-    def load_graph(self, path: str):
-        """Loads the graph from a pickle file."""
+    def set_cache_budget(self, budget_bytes: int):
+        """Sets how much memory (estimated) loaded graphs may hold before unpinned ones are evicted."""
+        self._cache.budget_bytes = budget_bytes
+        self._cache.evict()
+
+    def load_graph(self, path: str) -> GraphHandle:
+        """
+        Returns a handle on the graph at path: a store directory, or a
+        .gpickle file through the store converted from it (written alongside
+        it on first load, and again whenever the .gpickle is newer). Graphs
+        are shared through the cache, so opening a loaded one is immediate.
+        The caller releases the handle when done with the graph.
+        """
+        if path.endswith('.gpickle'):
+            store_path = os.path.splitext(path)[0] + STORE_SUFFIX
+            if not GraphStore.is_store(store_path) or os.path.getmtime(path) > GraphStore.modified_time(store_path):
+                print(f"Converting {path} to a graph store...")
+                convert_gpickle(path, store_path, dem=get_dem())
+                self._cache.discard(os.path.abspath(store_path))
+            path = store_path
+        handle = self._cache.open(os.path.abspath(path), lambda: self._open_graph(path))
+        print(f"Opened graph: {handle.name} ({len(self._cache)} cached, ~{self._cache.nbytes / 1e6:.0f} MB)")
+        return handle
+
+    @staticmethod
+    def _open_graph(path: str) -> LoadedGraph:
+        """Opens the store at path with its snapshot, edge samples and geometry."""
         print(f"Loading graph from {path}...")
         try:
-            with open(path, 'rb') as f:
-                self._graph = pickle.load(f)
-            # Derive the active name from the filename
-            self._active_name = os.path.splitext(os.path.basename(path))[0]
-            print(f"Graph loaded successfully: {self._active_name}")
-
-            # Auto-add elevation if missing (migration for old graphs)
-            sample_node = next(iter(self._graph.nodes))
-            if 'elevation' not in self._graph.nodes[sample_node]:
-                print("Graph missing elevation data, adding...")
-                self._add_elevation_data(self._graph)
-                # Save back with elevation
-                with open(path, 'wb') as f:
-                    pickle.dump(self._graph, f, pickle.HIGHEST_PROTOCOL)
-                print("Elevation data added and graph re-saved.")
+            store = GraphStore.open(path)
+            snapshot = store.snapshot
+            print(f"Search snapshot mapped: {snapshot.num_nodes} nodes, {snapshot.num_edges} edges")
+            # Load the DEM tiles under the graph now rather than on the first route
+            node_x, node_y = snapshot.node_x, snapshot.node_y
+            tiles = get_dem().preload(float(node_y.min()), float(node_x.min()), float(node_y.max()), float(node_x.max()))
+            print(f"DEM tiles loaded: {tiles}")
+            edge_samples = store.edge_samples(get_dem())
+            print(f"Edge samples ready: {edge_samples.num_samples} points")
+            print(f"Graph loaded successfully: {store.name}")
+            return LoadedGraph(store.name, store, snapshot, edge_samples, store.edge_geometry())
         except Exception as e:
             print(f"Error loading graph: {e}")
             raise
 
-    def switch_graph(self, name: str):
-        """Switch to a different graph by name (without .gpickle extension)."""
+    def open_graph(self, name: str) -> GraphHandle:
+        """Returns a handle on a graph by name (a <name>.graph store or <name>.gpickle file); see load_graph."""
         if self._graphs_dir is None:
             raise ValueError("Graphs directory not set. Call set_graphs_dir() first.")
-        path = os.path.join(self._graphs_dir, f"{name}.gpickle")
-        if not os.path.exists(path):
-            raise FileNotFoundError(f"Graph file not found: {path}")
-        self.load_graph(path)
-
-    def get_active_name(self) -> str:
-        """Returns the name of the currently loaded graph."""
-        return self._active_name
+        gpickle_path = os.path.join(self._graphs_dir, f"{name}.gpickle")
+        store_path = os.path.join(self._graphs_dir, f"{name}{STORE_SUFFIX}")
+        if os.path.exists(gpickle_path):
+            return self.load_graph(gpickle_path)
+        if GraphStore.is_store(store_path):
+            return self.load_graph(store_path)
+        raise FileNotFoundError(f"Graph file not found: {store_path}")
 
     @staticmethod
     def list_graphs(graphs_dir: str) -> list:
         """Lists available graph names (without extension) in the given directory."""
         if not os.path.isdir(graphs_dir):
             return []
-        return sorted([
+        return sorted({
             os.path.splitext(f)[0]
             for f in os.listdir(graphs_dir)
-            if f.endswith('.gpickle')
-        ])
+            if f.endswith('.gpickle') or (f.endswith(STORE_SUFFIX) and GraphStore.is_store(os.path.join(graphs_dir, f)))
+        })
 
     @staticmethod
     def get_graph_boundaries(graphs_dir: str) -> dict:
@@ -94,141 +119,93 @@ class GraphManager:
         with open(path, 'w') as f:
             json.dump(boundary_data, f)
 
-    def get_graph(self):
-        """Returns the loaded graph instance."""
-        if self._graph is None:
-            raise ValueError("Graph not loaded. Call load_graph() first.")
-        return self._graph
+    @staticmethod
+    def get_node_index(graph: LoadedGraph) -> NodeIndex:
+        """Returns graph's nearest-node index, built on first use and cached with the graph."""
+        return graph.index(NODE_INDEX, lambda g: NodeIndex.from_snapshot(g.snapshot))
 
-    def get_nearest_node(self, lat: float, lng: float):
-        """Finds the nearest node to the given coordinates."""
-        G = self.get_graph()
-        return ox.nearest_nodes(G, lng, lat)
+    def get_nearest_node(self, graph: LoadedGraph, lat: float, lng: float):
+        """Finds the nearest node of graph to the given coordinates."""
+        return self.get_node_index(graph).nearest(lat, lng)
+
+    def get_nearest_nodes(self, graph: LoadedGraph, coordinates: list) -> list:
+        """Finds the nearest node of graph to each of a list of [lat, lng] pairs."""
+        if not coordinates:
+            return []
+        lat, lng = np.asarray(coordinates, dtype=np.float64).T
+        nodes, _ = self.get_node_index(graph).nearest_many(lat, lng)
+        return nodes.tolist()
 
-    def get_nodes_in_polygon(self, coordinates: list) -> list:
+    def get_nodes_in_polygon(self, graph: LoadedGraph, coordinates: list) -> list:
         """
-        Finds all nodes within a polygon defined by coordinates.
-        coordinates: List of [lat, lng] pairs (note: check if your polygon needs [lng, lat])
+        Finds all nodes of graph within a polygon defined by coordinates.
+        coordinates: List of [lat, lng] pairs
         Returns a list of node IDs.
         """
-        G = self.get_graph()
-        
-        # Ensure coordinates are in the correct order for Polygon (lng, lat)
-        # Frontend sends [lat, lng], so we swap
-        poly_coords = [(lng, lat) for lat, lng in coordinates]
-        
-        polygon = Polygon(poly_coords)
-        
-        nodes_in_region = []
-        
-        # Basic implementation: check every node. Optimization: use spatial index if needed.
-        # For typical graphs (thousands of nodes), this might be slow.
-        # Better: use ox.graph_to_gdfs to get nodes as GeoDataFrame, then sjoin or within.
-        
-        gdf_nodes = ox.graph_to_gdfs(G, nodes=True, edges=False)
-        
-        # Create a GeoSeries with the polygon
-        poly_gdf = gpd.GeoSeries([polygon], crs=gdf_nodes.crs) # Assumes graph crs matches if not specified, usually lat/lon is 4326
-
-        # Actually, ox graphs usually have crs. 
-        # If coordinates are lat/lng, we assume EPSG:4326.
-        
-        # Check if nodes are within the polygon
-        # This is strictly for "drawing" feature which returns a mask of nodes.
-        
-        # Let's do a simple bounding box check first if we care about perf, 
-        # but geopandas `within` is reasonably optimized.
-        
-        # However, checking every node might be heavy.
-        # Let's stick to the simplest correct method first.
-        
-        # Create geometry for all nodes
-        # filtered = gdf_nodes[gdf_nodes.geometry.within(polygon)]
-        
-        # Actually, let's just use the geometry from the GDF
-        mask = gdf_nodes.intersects(polygon)
-        filtered_nodes = gdf_nodes[mask]
-        
-        return filtered_nodes.index.tolist()
+        lat, lng = np.asarray(coordinates, dtype=np.float64).T
+        return self.get_node_index(graph).nodes_in_polygon(lat, lng).tolist()
 
-    def get_nodes_near_polyline(self, coordinates: list, buffer_meters: float = 300.0) -> list:
+    def get_nodes_near_polyline(self, graph: LoadedGraph, coordinates: list, buffer_meters: float = 300.0) -> list:
         """
-        Finds all nodes within a certain distance of a polyline.
+        Finds all nodes of graph within buffer_meters of a polyline.
         coordinates: List of [lat, lng] pairs
-        buffer_meters: Distance in meters to buffer the line (approximate if using varying projection, 
-                       but for small areas simple degree conversion or treating as meters if projected is needed.
-                       However, osmnx graphs are usually unprojected (lat/lon). 
-                       Buffering lat/lon by 'meters' requires projection.)
+        Distances are measured in metres in the graph's local projection (see NodeIndex).
         """
-        G = self.get_graph()
-        
-        # Swap because frontend sends [lat, lng], shapely wants (lng, lat)
-        line_coords = [(lng, lat) for lat, lng in coordinates]
-        line = LineString(line_coords)
-        
-        # Project to UTM for accurate buffering in meters
-        # We can use the graph's UTM projection if it has one, or project the geometry.
-        # Simple heuristic: 1 degree approx 111km. 20m is approx 0.00018 degrees.
-        # Let's use a rough degree approximation for speed/simplicity if we don't want to reproject everything.
-        # 20m / 111000m/deg ~= 0.00018
-        buffer_degrees = buffer_meters / 111111.0
-        
-        polygon = line.buffer(buffer_degrees)
-        
-        gdf_nodes = ox.graph_to_gdfs(G, nodes=True, edges=False)
-        
-        mask = gdf_nodes.intersects(polygon)
-        filtered_nodes = gdf_nodes[mask]
-        
-        return filtered_nodes.index.tolist()
+        if not coordinates:
+            return []
+        lat, lng = np.asarray(coordinates, dtype=np.float64).T
+        return self.get_node_index(graph).nodes_near_line(lat, lng, buffer_meters).tolist()
 
-    def get_edges_near_polyline(self, coordinates: list, buffer_meters: float = 25.0):
+    def get_edges_near_polyline(self, graph: LoadedGraph, coordinates: list, buffer_meters: float = 25.0):
         """
         Finds shortest path between two clicked points on the graph.
-        Snaps both to nearest nodes, returns path nodes + edge GeoJSON.
+        Snaps both to nearest nodes, returns path nodes + the path's GeoJSON
+        LineString text (see EdgeGeometry), or None if it has no edges.
+        Routes on the CSR snapshot, so the NetworkX graph is never built.
         """
-        G = self.get_graph()
-
         if len(coordinates) < 2:
             return [], None
 
-        start_lat, start_lng = coordinates[0]
-        end_lat, end_lng = coordinates[-1]
-
-        start_node = ox.nearest_nodes(G, start_lng, start_lat)
-        end_node = ox.nearest_nodes(G, end_lng, end_lat)
+        start_node, end_node = self.get_nearest_nodes(graph, [coordinates[0], coordinates[-1]])
 
         if start_node == end_node:
             return [start_node], None
 
-        try:
-            path = nx.shortest_path(G, start_node, end_node, weight='length')
-        except nx.NetworkXNoPath:
+        path = self._shortest_path(graph.snapshot, start_node, end_node)
+        if not path:
             print(f"No path found between {start_node} and {end_node}")
             return [], None
 
-        # Extract edge geometries along the path
-        edge_geometries = []
-        for u, v in zip(path[:-1], path[1:]):
-            if G.has_edge(u, v):
-                data = G[u][v][0] if G.is_multigraph() else G[u][v]
-                if 'geometry' in data:
-                    edge_geometries.append(data['geometry'])
-                else:
-                    p1 = (G.nodes[u]['x'], G.nodes[u]['y'])
-                    p2 = (G.nodes[v]['x'], G.nodes[v]['y'])
-                    edge_geometries.append(LineString([p1, p2]))
-
-        edges_geojson = None
-        if edge_geometries:
-            multi = MultiLineString(edge_geometries)
-            edges_geojson = {
-                "type": "Feature",
-                "geometry": mapping(multi),
-                "properties": {}
-            }
+        return path, graph.edge_geometry.linestring_json(path)
 
-        return path, edges_geojson
+    @staticmethod
+    def _shortest_path(snapshot, source: int, target: int) -> list:
+        """Dijkstra by edge length over the snapshot, stopping at target. Returns [] if it is unreachable."""
+        offsets, targets, lengths = snapshot.adjacency()[:3]
+        inf = float('inf')
+        dist = {source: 0.0}
+        prev = {}
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u == target:
+                break
+            if d > dist[u]:
+                continue
+            for e in range(offsets[u], offsets[u + 1]):
+                v, nd = targets[e], d + lengths[e]
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd, v))
+
+        if target not in prev:
+            return []
+        path = [target]
+        while path[-1] != source:
+            path.append(prev[path[-1]])
+        path.reverse()
+        return path
 
     def create_node_mask(self, node_ids: list) -> int:
         """Creates a bitmask from a list of node IDs."""
@@ -553,9 +530,8 @@ class GraphManager:
         self._add_elevation_data(G)
 
         os.makedirs(self._graphs_dir, exist_ok=True)
-        file_path = os.path.join(self._graphs_dir, f"{name}.gpickle")
-        with open(file_path, 'wb') as f:
-            pickle.dump(G, f, pickle.HIGHEST_PROTOCOL)
+        file_path = write_store(G, os.path.join(self._graphs_dir, f"{name}{STORE_SUFFIX}"), get_dem())
+        self._cache.discard(os.path.abspath(file_path))
 
         # Save boundary metadata
         self._save_boundary(name, boundary_metadata, exclusion_zones)
@@ -633,18 +609,20 @@ class GraphManager:
 
     @staticmethod
     def _add_elevation_data(G):
-        """Adds elevation (meters) to each node using SRTM data.
+        """Adds elevation (meters) to each node using SRTM data, sampled from the DEM in one pass.
         SRTM tiles are automatically downloaded and cached on first use."""
         print("Adding elevation data from SRTM...")
-        elevation_data = srtm.get_data()
-        missing = 0
-        for node, data in G.nodes(data=True):
-            lat = data.get('y', 0)
-            lng = data.get('x', 0)
-            elev = elevation_data.get_elevation(lat, lng)
-            data['elevation'] = elev if elev is not None else 0
-            if elev is None:
-                missing += 1
+        nodes = list(G.nodes(data=True))
+        lat = np.array([data.get('y', 0) for _, data in nodes], dtype=np.float64)
+        lng = np.array([data.get('x', 0) for _, data in nodes], dtype=np.float64)
+        # Tiles that fail to download raise here; only areas SRTM doesn't cover get 0
+        get_dem().preload(float(lat.min()), float(lng.min()), float(lat.max()), float(lng.max()), strict=True)
+        elevations = get_dem().elevations(lat, lng)
+        unknown = np.isnan(elevations)
+        elevations[unknown] = 0
+        for (_, data), elev in zip(nodes, elevations.tolist()):
+            data['elevation'] = elev
+        missing = int(unknown.sum())
         if missing > 0:
             print(f"Warning: {missing} nodes had no SRTM elevation data (set to 0).")
         print(f"Elevation added to {len(G.nodes) - missing}/{len(G.nodes)} nodes.")
@@ -0,0 +1,355 @@
+import heapq
+import sys
+from typing import List, Tuple
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x: int) -> int:
+    """splitmix64 finalizer: spreads an integer key over 64 bits."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def _lists_nbytes(lists) -> int:
+    """Memory of some plain lists: their storage plus each element object (shared small ints included)."""
+    return sum(sys.getsizeof(values) + sum(map(sys.getsizeof, values)) for values in lists)
+
+
+def flatten_edge_names(name_data) -> frozenset:
+    """Flattens an edge 'name' attribute (str, list, nested lists or None) into a frozenset."""
+    if name_data is None:
+        return frozenset()
+    if isinstance(name_data, str):
+        return frozenset((name_data,))
+    if isinstance(name_data, list):
+        flat = set()
+        for item in name_data:
+            flat.update(flatten_edge_names(item))
+        return frozenset(flat)
+    return frozenset((str(name_data),))
+
+
+class GraphSnapshot:
+    """
+    Frozen compressed-sparse-row view of a road graph for the loop search.
+
+    Node ids are the sequential integers written by GraphManager._relabel_graph.
+    The out-edges of node u are the slots offsets[u]:offsets[u + 1] of the
+    edge arrays (targets, lengths, name_ids). Parallel edges between the same
+    pair of nodes collapse to one slot using key 0, matching what the search
+    has always read via G[u][v][0].
+
+    Turn transitions: arriving over edge e at node v and leaving over the j-th
+    out-edge of v is a turn iff turn_flags[turn_offsets[e] + j] == 1, i.e. the
+    two edges share no street name.
+    """
+
+    def __init__(self, offsets, targets, lengths, name_ids, names, node_x, node_y,
+                 turn_offsets=None, turn_flags=None):
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self.name_ids = name_ids
+        self.names = tuple(names)  # name_id -> frozenset of street names/refs
+        self.node_x = node_x
+        self.node_y = node_y
+        if turn_offsets is None or turn_flags is None:
+            turn_offsets, turn_flags = self._build_turn_table(offsets, targets, name_ids, self.names)
+        self.turn_offsets = turn_offsets
+        self.turn_flags = turn_flags
+        for arr in (offsets, targets, lengths, name_ids, node_x, node_y, turn_offsets, turn_flags):
+            arr.flags.writeable = False
+        self._lists = None
+        self._reverse_lists = None
+        self._lists_bytes = 0
+        self._reverse_lists_bytes = 0
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    @property
+    def list_nbytes(self) -> int:
+        """Memory of the cached adjacency() and reverse_adjacency() lists; 0 until they are built."""
+        return self._lists_bytes + self._reverse_lists_bytes
+
+    @classmethod
+    def from_graph(cls, G) -> 'GraphSnapshot':
+        """Builds a snapshot from a MultiDiGraph with nodes labelled 0..n-1."""
+        n = G.number_of_nodes()
+        if set(G.nodes) != set(range(n)):
+            raise ValueError("GraphSnapshot requires sequential integer node ids (see GraphManager._relabel_graph).")
+
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        targets = []
+        lengths = []
+        name_ids = []
+        names = [frozenset()]
+        name_index = {frozenset(): 0}
+
+        for u in range(n):
+            for v, edges in G.adj[u].items():
+                data = edges[0] if 0 in edges else next(iter(edges.values()))
+                name_set = flatten_edge_names(data.get('name'))
+                name_id = name_index.get(name_set)
+                if name_id is None:
+                    name_id = name_index[name_set] = len(names)
+                    names.append(name_set)
+                targets.append(v)
+                lengths.append(data.get('length', 0))
+                name_ids.append(name_id)
+            offsets[u + 1] = len(targets)
+
+        node_x = np.array([G.nodes[u].get('x', 0.0) for u in range(n)], dtype=np.float64)
+        node_y = np.array([G.nodes[u].get('y', 0.0) for u in range(n)], dtype=np.float64)
+
+        return cls(
+            offsets,
+            np.array(targets, dtype=np.int32),
+            np.array(lengths, dtype=np.float64),
+            np.array(name_ids, dtype=np.int32),
+            names,
+            node_x,
+            node_y,
+        )
+
+    @staticmethod
+    def _build_turn_table(offsets, targets, name_ids, names):
+        """Computes the is-turn flag for every (incoming edge, outgoing edge) pair."""
+        out_degree = np.diff(offsets)
+        # Each edge e = u->v owns one flag per out-edge of v
+        row_len = out_degree[targets]
+        turn_offsets = np.zeros(len(targets) + 1, dtype=np.int64)
+        np.cumsum(row_len, out=turn_offsets[1:])
+        total = int(turn_offsets[-1])
+
+        in_edges = np.repeat(np.arange(len(targets), dtype=np.int64), row_len)
+        out_edges = offsets[targets[in_edges]] + (np.arange(total, dtype=np.int64) - turn_offsets[in_edges])
+
+        # Only distinct (name, name) pairs need a set intersection
+        num_names = len(names)
+        pair_keys = name_ids[in_edges].astype(np.int64) * num_names + name_ids[out_edges]
+        unique_keys, inverse = np.unique(pair_keys, return_inverse=True)
+        unique_flags = np.fromiter(
+            (0 if names[k // num_names] & names[k % num_names] else 1 for k in unique_keys.tolist()),
+            dtype=np.uint8,
+            count=len(unique_keys),
+        )
+        turn_flags = unique_flags[inverse.reshape(-1)]
+        return turn_offsets, turn_flags
+
+    def adjacency(self):
+        """
+        Returns (offsets, targets, lengths, name_ids, turn_offsets, turn_flags)
+        as plain Python lists. Indexing a list is several times faster than
+        indexing a NumPy array element by element, so the search loop reads
+        these. Built once and cached.
+        """
+        if self._lists is None:
+            lists = (
+                self.offsets.tolist(),
+                self.targets.tolist(),
+                self.lengths.tolist(),
+                self.name_ids.tolist(),
+                self.turn_offsets.tolist(),
+                self.turn_flags.tolist(),
+            )
+            self._lists_bytes = _lists_nbytes(lists)
+            self._lists = lists
+        return self._lists
+
+    def reverse_adjacency(self):
+        """
+        Returns (in_offsets, in_edges, sources) as plain lists. The edges
+        arriving at node v are in_edges[in_offsets[v]:in_offsets[v + 1]] and
+        sources[e] is the tail node of edge e. Built once and cached.
+        """
+        if self._reverse_lists is None:
+            n = self.num_nodes
+            in_edges = np.argsort(self.targets, kind='stable')
+            in_offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=n), out=in_offsets[1:])
+            sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.offsets))
+            lists = (in_offsets.tolist(), in_edges.tolist(), sources.tolist())
+            self._reverse_lists_bytes = _lists_nbytes(lists)
+            self._reverse_lists = lists
+        return self._reverse_lists
+
+    def extract_local(self, start: int, radius: float) -> 'LocalGraph':
+        """
+        Extracts the nodes within `radius` metres of `start` (ignoring edge
+        direction) as a LocalGraph relabelled 0..k-1 in the order Dijkstra
+        settles them, so the start is local node 0.
+        """
+        offsets, targets, lengths, name_ids, turn_offsets, turn_flags = self.adjacency()
+        in_offsets, in_edges, sources = self.reverse_adjacency()
+
+        local_of = {}
+        order = []
+        best = {start: 0.0}
+        heap = [(0.0, start)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in local_of:
+                continue
+            local_of[u] = len(order)
+            order.append(u)
+            for e in range(offsets[u], offsets[u + 1]):
+                v, nd = targets[e], d + lengths[e]
+                if nd <= radius and nd < best.get(v, nd + 1):
+                    best[v] = nd
+                    heapq.heappush(heap, (nd, v))
+            for i in range(in_offsets[u], in_offsets[u + 1]):
+                e = in_edges[i]
+                v, nd = sources[e], d + lengths[e]
+                if nd <= radius and nd < best.get(v, nd + 1):
+                    best[v] = nd
+                    heapq.heappush(heap, (nd, v))
+
+        # Local CSR keeps only edges with both ends inside the radius
+        l_offsets = [0]
+        l_targets, l_lengths, l_name_ids, l_edge_ids = [], [], [], []
+        for u in order:
+            for e in range(offsets[u], offsets[u + 1]):
+                lv = local_of.get(targets[e])
+                if lv is None:
+                    continue
+                l_targets.append(lv)
+                l_lengths.append(lengths[e])
+                l_name_ids.append(name_ids[e])
+                l_edge_ids.append(e)
+            l_offsets.append(len(l_targets))
+
+        # Re-slice the turn table onto the surviving out-edges
+        l_turn_offsets = [0]
+        l_turn_flags = []
+        for le, ge in enumerate(l_edge_ids):
+            lv = l_targets[le]
+            base = turn_offsets[ge] - offsets[targets[ge]]
+            for lf in range(l_offsets[lv], l_offsets[lv + 1]):
+                l_turn_flags.append(turn_flags[base + l_edge_ids[lf]])
+            l_turn_offsets.append(len(l_turn_flags))
+
+        return LocalGraph(order, l_offsets, l_targets, l_lengths, l_name_ids, l_edge_ids, l_turn_offsets, l_turn_flags)
+
+    def edge_id(self, u: int, v: int) -> int:
+        """Returns the slot of edge u->v, or -1 if there is none."""
+        start, end = int(self.offsets[u]), int(self.offsets[u + 1])
+        hits = np.flatnonzero(self.targets[start:end] == v)
+        return start + int(hits[0]) if len(hits) else -1
+
+    def path_edges(self, path: List[int]) -> List[int]:
+        """Edge slots traversed by a node path; steps with no edge are skipped."""
+        offsets, targets = self.adjacency()[:2]
+        edges = []
+        for u, v in zip(path[:-1], path[1:]):
+            try:
+                edges.append(targets.index(v, offsets[u], offsets[u + 1]))
+            except ValueError:
+                continue
+        return edges
+
+
+class LocalGraph:
+    """
+    Search-local CSR graph produced by GraphSnapshot.extract_local.
+
+    Uses the same list layout as GraphSnapshot.adjacency() but with dense
+    local node ids, so visited bitmasks only span the search neighbourhood.
+    global_ids[local] and edge_ids[local_edge] map back to the snapshot.
+    """
+    __slots__ = ['global_ids', 'offsets', 'targets', 'lengths', 'name_ids',
+                 'edge_ids', 'turn_offsets', 'turn_flags']
+
+    def __init__(self, global_ids, offsets, targets, lengths, name_ids, edge_ids, turn_offsets, turn_flags):
+        self.global_ids = global_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self.name_ids = name_ids
+        self.edge_ids = edge_ids
+        self.turn_offsets = turn_offsets
+        self.turn_flags = turn_flags
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.global_ids)
+
+    def adjacency(self):
+        """Returns (offsets, targets, lengths, name_ids, turn_offsets, turn_flags)."""
+        return self.offsets, self.targets, self.lengths, self.name_ids, self.turn_offsets, self.turn_flags
+
+    def start_distances(self) -> Tuple[List[float], List[float]]:
+        """
+        Returns (dist_out, return_bound) per local node. dist_out is the
+        Dijkstra tree distance from the start. return_bound is a lower bound on
+        the distance a route still has to cover after reaching the node: routes
+        end by retracing their out-and-back leg, so from v the cheapest finish
+        is min over L of (v -> L) + dist_out[L]. On two-way streets the two
+        lists are equal; unreachable nodes get inf.
+        """
+        n = self.num_nodes
+        offsets, targets, lengths = self.offsets, self.targets, self.lengths
+        inf = float('inf')
+
+        dist_out = [inf] * n
+        if n == 0:
+            return dist_out, []
+        dist_out[0] = 0.0
+        heap = [(0.0, 0)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist_out[u]:
+                continue
+            for e in range(offsets[u], offsets[u + 1]):
+                v, nd = targets[e], d + lengths[e]
+                if nd < dist_out[v]:
+                    dist_out[v] = nd
+                    heapq.heappush(heap, (nd, v))
+
+        incoming = [[] for _ in range(n)]
+        for u in range(n):
+            for e in range(offsets[u], offsets[u + 1]):
+                incoming[targets[e]].append((u, lengths[e]))
+
+        # Multi-source Dijkstra over reversed edges, seeded with the tree distances
+        bound = list(dist_out)
+        heap = [(d, v) for v, d in enumerate(bound) if d < inf]
+        heapq.heapify(heap)
+        while heap:
+            d, v = heapq.heappop(heap)
+            if d > bound[v]:
+                continue
+            for u, length in incoming[v]:
+                nd = d + length
+                if nd < bound[u]:
+                    bound[u] = nd
+                    heapq.heappush(heap, (nd, u))
+        return dist_out, bound
+
+    def edge_hashes(self) -> List[int]:
+        """
+        64-bit hash per local edge of its undirected global endpoint pair, so
+        u->v and v->u hash alike and values agree across searches.
+        """
+        global_ids, offsets, targets = self.global_ids, self.offsets, self.targets
+        hashes = []
+        for u in range(self.num_nodes):
+            gu = global_ids[u]
+            for e in range(offsets[u], offsets[u + 1]):
+                gv = global_ids[targets[e]]
+                hashes.append(_mix64((gu << 32) | gv if gu < gv else (gv << 32) | gu))
+        return hashes
+
+    def to_global(self, local_path: List[int]) -> List[int]:
+        """Translates a list of local node ids back to snapshot/graph node ids."""
+        global_ids = self.global_ids
+        return [global_ids[n] for n in local_path]
@@ -0,0 +1,211 @@
+import json
+import os
+import pickle
+import shutil
+import sys
+import threading
+from typing import Any, Dict, Optional
+import networkx as nx
+import numpy as np
+import shapely
+from edge_geometry import EdgeGeometry
+from edge_samples import SAMPLE_INTERVAL_M, EdgeSamples, edge_vertices
+from graph_snapshot import GraphSnapshot
+
+STORE_SUFFIX = '.graph'  # A store is a directory <name>.graph next to the .gpickle files
+STORE_VERSION = 1
+DEFAULT_CRS = 'epsg:4326'
+
+# Array files of a store, by role
+_NODE_FIELDS = ('node_x', 'node_y', 'node_elevation')
+_SNAPSHOT_FIELDS = ('offsets', 'targets', 'lengths', 'name_ids', 'turn_offsets', 'turn_flags')
+_GEOMETRY_FIELDS = ('vertex_start', 'vertex_x', 'vertex_y')
+# EdgeSamples constructor arguments after snapshot and interval_m
+_SAMPLE_FIELDS = ('sample_offsets', 'sample_dist', 'sample_lat', 'sample_lng', 'sample_bearing',
+                  'edge_length', 'edge_climb', 'edge_descent', 'edge_lat_sum', 'edge_lng_sum')
+
+
+def write_store(G, path: str, dem=None) -> str:
+    """
+    Writes G (a MultiDiGraph with nodes labelled 0..n-1) as a columnar store
+    at path: meta.json plus one .npy file per array. Edge samples are
+    computed now, with elevations from dem when given; raises
+    dem.DEMUnavailableError if its tiles for G fail to load. The directory is
+    written under a temporary name and renamed into place.
+    """
+    snapshot = GraphSnapshot.from_graph(G)
+    pt_start, _, pt_x, pt_y = edge_vertices(G, snapshot)
+    n = snapshot.num_nodes
+    # Samples written without DEM tiles have no climb; GraphStore.edge_samples rebuilds them once tiles exist.
+    # A tile that failed to load raises rather than being written as flat ground.
+    has_elevation = dem is not None and dem.preload(
+        float(snapshot.node_y.min()), float(snapshot.node_x.min()),
+        float(snapshot.node_y.max()), float(snapshot.node_x.max()), strict=True) > 0
+    samples = EdgeSamples.from_vertices(snapshot, pt_start, pt_x, pt_y, SAMPLE_INTERVAL_M, dem if has_elevation else None)
+    elevation = np.array([G.nodes[u].get('elevation', 0.0) for u in range(n)], dtype=np.float64)
+
+    arrays = {
+        'node_x': snapshot.node_x, 'node_y': snapshot.node_y, 'node_elevation': elevation,
+        'vertex_start': pt_start, 'vertex_x': pt_x, 'vertex_y': pt_y,
+    }
+    for field in _SNAPSHOT_FIELDS:
+        arrays[field] = getattr(snapshot, field)
+    sample_values = (samples.offsets, samples.dist, samples.lat, samples.lng, samples.bearing,
+                     samples.lengths, samples.climb, samples.descent, samples.lat_sum, samples.lng_sum)
+    arrays.update(zip(_SAMPLE_FIELDS, sample_values))
+
+    meta = {
+        'version': STORE_VERSION,
+        'num_nodes': n,
+        'num_edges': snapshot.num_edges,
+        'crs': str(G.graph.get('crs', DEFAULT_CRS)),
+        'names': [sorted(names) for names in snapshot.names],
+        'sample_interval_m': samples.interval_m,
+        'sample_elevation': has_elevation,
+    }
+
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for field, arr in arrays.items():
+        np.save(os.path.join(tmp_path, f'{field}.npy'), np.ascontiguousarray(arr))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+def convert_gpickle(gpickle_path: str, store_path: Optional[str] = None, dem=None) -> str:
+    """
+    Converts a .gpickle graph to a store (by default alongside it); returns
+    the store path. Graphs saved before nodes carried elevation get it from
+    dem here; like write_store, this raises if dem's tiles fail to load.
+    """
+    with open(gpickle_path, 'rb') as f:
+        G = pickle.load(f)
+    if dem is not None and any('elevation' not in data for _, data in G.nodes(data=True)):
+        print("Graph missing elevation data, adding...")
+        lat = np.array([data.get('y', 0) for _, data in G.nodes(data=True)], dtype=np.float64)
+        lng = np.array([data.get('x', 0) for _, data in G.nodes(data=True)], dtype=np.float64)
+        dem.preload(float(lat.min()), float(lng.min()), float(lat.max()), float(lng.max()), strict=True)
+        elevations = np.nan_to_num(dem.elevations(lat, lng), nan=0.0)
+        for (_, data), elev in zip(G.nodes(data=True), elevations.tolist()):
+            data['elevation'] = elev
+    if set(G.nodes) != set(range(len(G))):
+        G = nx.convert_node_labels_to_integers(G)
+    if store_path is None:
+        store_path = os.path.splitext(gpickle_path)[0] + STORE_SUFFIX
+    return write_store(G, store_path, dem)
+
+
+class GraphStore:
+    """
+    A graph opened from a columnar store. Arrays are memory-mapped, so
+    opening costs a few file maps and pages are read (and shared between
+    processes through the page cache) only as they are touched.
+
+    The search snapshot, edge samples and edge geometry are views over the
+    stored arrays. The NetworkX graph, which only some map tools still
+    need, is materialized on first use of .graph.
+    """
+
+    def __init__(self, path: str, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        self.path = path
+        self.meta = meta
+        self.arrays = arrays
+        self.name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+        self._snapshot = None
+        self._graph = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str, mmap: bool = True) -> 'GraphStore':
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported graph store version {meta.get('version')} in {path}")
+        fields = _NODE_FIELDS + _SNAPSHOT_FIELDS + _GEOMETRY_FIELDS + _SAMPLE_FIELDS
+        arrays = {
+            field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode='r' if mmap else None)
+            for field in fields
+        }
+        return cls(path, meta, arrays)
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, 'meta.json'))
+
+    @staticmethod
+    def modified_time(path: str) -> float:
+        """When the store at path was written (meta.json is written last)."""
+        return os.path.getmtime(os.path.join(path, 'meta.json'))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the stored arrays (mapped, so only the pages read are resident)."""
+        return sum(arr.nbytes for arr in self.arrays.values())
+
+    @property
+    def graph_built(self) -> bool:
+        return self._graph is not None
+
+    @property
+    def snapshot(self) -> GraphSnapshot:
+        if self._snapshot is None:
+            a = self.arrays
+            names = [frozenset(names) for names in self.meta['names']]
+            self._snapshot = GraphSnapshot(
+                a['offsets'], a['targets'], a['lengths'], a['name_ids'], names, a['node_x'], a['node_y'],
+                a['turn_offsets'], a['turn_flags'])
+        return self._snapshot
+
+    def edge_samples(self, dem=None) -> EdgeSamples:
+        """Stored edge samples; rebuilt in memory if they lack elevation and dem has tiles for the graph."""
+        a = self.arrays
+        if not self.meta['sample_elevation'] and dem is not None:
+            node_x, node_y = a['node_x'], a['node_y']
+            if dem.preload(float(node_y.min()), float(node_x.min()), float(node_y.max()), float(node_x.max())):
+                return EdgeSamples.from_vertices(self.snapshot, a['vertex_start'], a['vertex_x'], a['vertex_y'],
+                                                 self.meta['sample_interval_m'], dem)
+        return EdgeSamples(self.snapshot, self.meta['sample_interval_m'], *(a[field] for field in _SAMPLE_FIELDS))
+
+    def edge_geometry(self) -> EdgeGeometry:
+        a = self.arrays
+        return EdgeGeometry(self.snapshot, a['vertex_start'], a['vertex_x'], a['vertex_y'])
+
+    @property
+    def graph(self) -> nx.MultiDiGraph:
+        """The NetworkX graph, built from the arrays on first use (one edge per snapshot slot, key 0)."""
+        with self._lock:
+            if self._graph is None:
+                self._graph = self._to_networkx()
+            return self._graph
+
+    def _to_networkx(self) -> nx.MultiDiGraph:
+        a = self.arrays
+        snapshot = self.snapshot
+        G = nx.MultiDiGraph(crs=self.meta.get('crs', DEFAULT_CRS))
+        node_x, node_y, elevation = a['node_x'].tolist(), a['node_y'].tolist(), a['node_elevation'].tolist()
+        G.add_nodes_from((u, {'x': x, 'y': y, 'elevation': z}) for u, (x, y, z) in enumerate(zip(node_x, node_y, elevation)))
+
+        vertex_start = np.asarray(a['vertex_start'])
+        coords = np.column_stack([a['vertex_x'], a['vertex_y']])
+        geometries = shapely.linestrings(coords, indices=np.repeat(np.arange(snapshot.num_edges), np.diff(vertex_start)))
+        name_values = [None if not names else next(iter(names)) if len(names) == 1 else sorted(names)
+                       for names in snapshot.names]
+        sources = np.repeat(np.arange(snapshot.num_nodes), np.diff(snapshot.offsets)).tolist()
+        G.add_edges_from(
+            (u, v, 0, {'length': length, 'name': name_values[name_id], 'geometry': geometry})
+            for u, v, length, name_id, geometry in zip(
+                sources, snapshot.targets.tolist(), snapshot.lengths.tolist(), snapshot.name_ids.tolist(), geometries)
+        )
+        return G
+
+
+if __name__ == '__main__':
+    # python graph_store.py graphs/*.gpickle
+    from dem import get_dem
+    for gpickle_path in sys.argv[1:]:
+        print(f"Converting {gpickle_path}...")
+        print(f"Wrote {convert_gpickle(gpickle_path, dem=get_dem())}")
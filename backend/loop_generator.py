@@ -1,26 +1,34 @@
 
-import heapq
 import math
 from typing import List, Tuple, Dict, Any, Generator, Optional, Set
 import networkx as nx
 import shapely.geometry
 from shapely.ops import linemerge
-import srtm
+import numpy as np
 from pyproj import Geod
 import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from graph_snapshot import GraphSnapshot, LocalGraph
+from dem import get_dem
+from dedup_index import CentroidIndex, MinHashIndex
+from edge_geometry import SUMMARY_TOLERANCE_M, EdgeGeometry
+from edge_samples import EdgeSamples
+from search_queue import BucketQueue
+from path_pool import PathPool
+from wire import RawJSON
 
 # Constants
 MILES_PER_METER = 0.000621371
 FEET_PER_METER = 3.28084
 MIN_LOOP_LENGTH_METERS = 1000  # Minimum loop length to be considered valid
+MAX_SEARCH_ITERATIONS = 1000000  # Safety stop for one search
+ENRICH_WORKERS = 4  # Threads computing elevation/properties/GeoJSON for accepted loops
+PIPELINE_DEPTH = 16  # Accepted loops buffered between the search and the consumer
+PIPELINE_POLL_S = 0.05  # How often a blocked search thread re-checks for shutdown
 
-# Initialize SRTM downloader
-_srtm_data = None
-def _get_srtm():
-    global _srtm_data
-    if _srtm_data is None:
-        _srtm_data = srtm.get_data()
-    return _srtm_data
+_PIPELINE_DONE = object()  # End-of-stream marker from the search thread
 
 # Initialize Geod for bearing/distance
 _geod = Geod(ellps='WGS84')
@@ -171,29 +179,56 @@ def weight_function_turns_dist(G, u_node, v, current_turns, current_dist):
 
 def jaccard_similarity(set1_mask: int, set2_mask: int) -> float:
     """Calculates Jaccard similarity between two bitmasks."""
-    intersection = bin(set1_mask & set2_mask).count('1')
-    union = bin(set1_mask | set2_mask).count('1')
+    intersection = (set1_mask & set2_mask).bit_count()
+    union = (set1_mask | set2_mask).bit_count()
     return intersection / union if union > 0 else 0.0
 
-def _is_unique_path(
+def _admit_label(
+    bucket: List[Tuple[int, float, int, int]],
+    turns: int,
+    dist: float,
     mask: int,
-    existing_masks: Set[int],
-    similarity_threshold: float
+    max_labels: int,
+    evicted: Set[int]
 ) -> bool:
-    """Checks if path is sufficiently unique using Jaccard similarity."""
-    for existing in existing_masks:
-        if jaccard_similarity(mask, existing) > similarity_threshold:
+    """
+    Label-setting dominance check for one (node, incoming edge) state.
+    A label dominates another if it has no more turns, no more distance and
+    its visited set is a subset. Dominated labels already in the bucket are
+    evicted and their handles added to evicted, so the search skips them
+    when they are popped; returns False if the new label is
+    dominated or the bucket already holds max_labels labels. An admitted
+    label is appended with handle -1, for the caller to fill in at
+    bucket[-1] once it has allocated the state.
+    """
+    for b_turns, b_dist, b_mask, _ in bucket:
+        if b_turns <= turns and b_dist <= dist and (b_mask & mask) == b_mask:
             return False
+    kept = []
+    for label in bucket:
+        if turns <= label[0] and dist <= label[1] and (mask & label[2]) == mask:
+            evicted.add(label[3])
+        else:
+            kept.append(label)
+    bucket[:] = kept
+    if len(bucket) >= max_labels:
+        return False
+    bucket.append((turns, dist, mask, -1))
     return True
 
-def _sample_path_geometry(G, path, sample_interval_m=50):
-    """Yields (dist_m, lat, lng, bearing) uniformly sampled along path."""
+def _sample_path_geometry(G, path, sample_interval_m=50, edge_samples: Optional[EdgeSamples] = None):
+    """Yields (dist_m, lat, lng, bearing) uniformly sampled along path.
+    Reads precomputed edge_samples when they were built at this interval."""
     cumulative_m = 0.0
     
     # Check start
     if not path:
         return
 
+    if edge_samples is not None and edge_samples.interval_m == sample_interval_m:
+        yield from zip(*(column.tolist() for column in edge_samples.sample_path(path)))
+        return
+
     for u, v in zip(path[:-1], path[1:]):
         if G.has_edge(u, v):
             data = G[u][v][0] if G.is_multigraph() else G[u][v]
@@ -241,10 +276,13 @@ def _sample_path_geometry(G, path, sample_interval_m=50):
             
         cumulative_m += edge_length_m
 
-def _calculate_path_centroid(G: nx.MultiDiGraph, path_nodes: List[int]) -> Optional[Tuple[float, float]]:
-    """Calculates centroid (avg lat, avg lng) using uniform geometry sampling."""
+def _calculate_path_centroid(G: nx.MultiDiGraph, path_nodes: List[int], edge_samples: Optional[EdgeSamples] = None) -> Optional[Tuple[float, float]]:
+    """Calculates centroid (avg lat, avg lng) using uniform geometry sampling,
+    or as the length-weighted mean of the route geometry from edge_samples."""
     if not path_nodes:
         return None
+    if edge_samples is not None:
+        return edge_samples.path_stats(path_nodes)[3]
         
     sum_lat = 0.0
     sum_lng = 0.0
@@ -252,7 +290,7 @@ def _calculate_path_centroid(G: nx.MultiDiGraph, path_nodes: List[int]) -> Optio
     
     # Use the same sampling as elevation profile for consistency
     last_dist_m = -1000.0
-    for dist_m, lat, lng, _ in _sample_path_geometry(G, path_nodes, sample_interval_m=50):
+    for dist_m, lat, lng, _ in _sample_path_geometry(G, path_nodes, sample_interval_m=50, edge_samples=edge_samples):
         if dist_m < last_dist_m + 1.0:
             continue
         last_dist_m = dist_m
@@ -266,59 +304,31 @@ def _calculate_path_centroid(G: nx.MultiDiGraph, path_nodes: List[int]) -> Optio
         
     return (sum_lat / count, sum_lng / count)
 
-def _is_centroid_too_close(
-    centroid: Optional[Tuple[float, float]],
-    existing_centroids: List[Tuple[float, float]],
-    min_dist_m: float = 50.0 
-) -> bool:
-    """Checks if centroid is too close to any existing centroids (distance in meters)."""
-    if not centroid:
-        return False
-        
-    lat, lng = centroid
-    # Approx conversion: 1 deg lat = 111,139 m. Longitude varies but this is a rough filter.
-    # We use a safe approximation for "too close".
-    min_dist_deg = min_dist_m / 111139.0
-    threshold_sq = min_dist_deg * min_dist_deg
-    
-    for ex_lat, ex_lng in existing_centroids:
-        d_lat = lat - ex_lat
-        d_lng = lng - ex_lng
-        if (d_lat*d_lat + d_lng*d_lng) < threshold_sq:
-            return True
-            
-    return False
-
-def compute_elevation_profile(G, path, sample_interval_m=50):
-    """Samples SRTM elevation along path. Uses _sample_path_geometry."""
-    elev_data = _get_srtm()
-    profile = []
-    
-    total_climb = 0.0
-    total_descent = 0.0
-    prev_elev = None
+def compute_elevation_profile(G, path, sample_interval_m=50, edge_samples: Optional[EdgeSamples] = None):
+    """Samples elevation along path from the in-memory DEM. Uses _sample_path_geometry."""
+    # Filter duplicates (e.g. edge boundaries)
+    samples = []
     last_dist_m = -1000.0
-
-    for dist_m, lat, lng, bearing in _sample_path_geometry(G, path, sample_interval_m):
-        # Filter duplicates (e.g. edge boundaries)
-        if dist_m < last_dist_m + 1.0: 
-             continue
-        last_dist_m = dist_m
-
-        elev_m = elev_data.get_elevation(lat, lng)
-        if elev_m is None: continue
-        elev_ft = elev_m * FEET_PER_METER
-        
-        dist_mi = dist_m * MILES_PER_METER
-        
-        if prev_elev is not None:
-            delta = elev_ft - prev_elev
-            if delta > 0: total_climb += delta
-            else: total_descent += abs(delta)
-        prev_elev = elev_ft
-        
-        profile.append([round(dist_mi, 3), round(elev_ft, 1), round(lat, 6), round(lng, 6), bearing])
-
+    for sample in _sample_path_geometry(G, path, sample_interval_m, edge_samples):
+        if sample[0] < last_dist_m + 1.0:
+            continue
+        last_dist_m = sample[0]
+        samples.append(sample)
+    if not samples:
+        return [], 0.0, 0.0
+
+    dist_m, lat, lng, bearing = (np.array(column) for column in zip(*samples))
+    elev_m = get_dem().elevations(lat, lng)
+    known = ~np.isnan(elev_m)
+    elev_ft = elev_m[known] * FEET_PER_METER
+    deltas = np.diff(elev_ft)
+    total_climb = float(deltas[deltas > 0].sum())
+    total_descent = float(-deltas[deltas < 0].sum())
+
+    profile = np.column_stack([
+        np.round(dist_m[known] * MILES_PER_METER, 3), np.round(elev_ft, 1),
+        np.round(lat[known], 6), np.round(lng[known], 6), bearing[known]
+    ]).tolist()
     return profile, round(total_climb, 0), round(total_descent, 0)
 
 def compute_difficulty(total_miles, total_climb_ft):
@@ -366,11 +376,26 @@ def _create_properties(
 def path_to_geojson(
     G: nx.MultiDiGraph,
     path: List[int],
-    properties: Dict[str, Any]
+    properties: Dict[str, Any],
+    edge_geometry: Optional[EdgeGeometry] = None,
+    tolerance_m: float = 0.0
 ) -> Optional[Dict[str, Any]]:
-    """Converts a sequence of node IDs to a GeoJSON Feature."""
+    """Converts a sequence of node IDs to a GeoJSON Feature. With
+    edge_geometry, the geometry is a LineString in route order, joined from
+    pre-encoded edge text (a wire.RawJSON) and simplified to tolerance_m
+    when given."""
     if not path:
         return None
+
+    if edge_geometry is not None:
+        geometry = edge_geometry.linestring_json(path, tolerance_m)
+        if geometry is None:
+            return None
+        return {
+            "type": "Feature",
+            "geometry": RawJSON(geometry),
+            "properties": properties
+        }
         
     line_strings = []
     
@@ -401,123 +426,351 @@ def path_to_geojson(
     }
 
 
-def find_paths_turns_dist(
-    G: nx.MultiDiGraph,
+def _search_loops(
+    local: LocalGraph,
     start_node: int,
     min_path_length: float,
     max_path_length: float,
     loop_ratio_floor: float,
-    similarity_ceiling: float,
-    min_loop_length: float = MIN_LOOP_LENGTH_METERS,
-    deduplication: str = 'centroid',
-    min_dist_m: float = 50.0
-) -> Generator[Dict[str, Any], None, None]:
-    """Yields unique loop paths meeting criteria using optimized Dijkstra-like search."""
-    # Priority queue: (turns, distance, node_id), current_node, visited_mask
-    queue = [((0, 0.0, start_node), PathNode(start_node), 0)]
-    path_masks: Set[int] = set()
-    existing_centroids: List[Tuple[float, float]] = []
+    min_loop_length: float,
+    path_masks: Set[int],
+    loop_fingerprints: Set[Tuple[int, int]],
+    max_labels: Optional[int] = None,
+    cancel_event=None
+) -> Generator[Tuple[int, int, List[int], float, float, float, Tuple[int, int]], None, None]:
+    """
+    Core turn/distance search over a LocalGraph. Yields loop candidates as
+    (turns, visited_mask, path, loop_dist, total_dist, loop_ratio, fingerprint)
+    with path in snapshot node ids; the caller decides whether to keep them.
+    path_masks holds masks already accepted and is consulted as the search
+    goes, so callers may add to it between candidates. cancel_event is
+    anything with is_set().
+    """
+    offsets, targets, lengths, _, turn_offsets, turn_flags = local.adjacency()
+    # Dijkstra tree from the start, and the shortest possible finish from each node;
+    # states that can't make it back are never queued
+    start_dist, return_dist = local.start_distances()
+    edge_hashes = local.edge_hashes()
+
+    # Search states live in the pool; the queue orders their handles by (turns, distance)
+    pool = PathPool()
+    add_state = pool.add
+    state_node, state_parent, state_dist, state_edge, state_masks = pool.node, pool.parent, pool.dist, pool.edge, pool.masks
+    state_depth = pool.depth
+    queue = BucketQueue(state_dist, state_node)
+    queue.push(0, 0.0, add_state(0, -1, 0.0, -1, 0))
+    # Label-setting mode: incoming edge -> live labels (turns, dist, mask, handle)
+    labels: Dict[int, List[Tuple[int, float, int, int]]] = {}
+    evicted: Set[int] = set()  # Handles of queued labels a later label dominated
 
     # print(f"Starting loop detection... range {min_path_length}-{max_path_length}m")
     
     iters = 0
-    MAX_ITERS = 1000000
-    # MAX_ITERS = 100000000
     while queue:
         iters += 1
-        if iters > MAX_ITERS:
-            print(f"Max iterations {MAX_ITERS} reached. Stopping.")
+        if iters > MAX_SEARCH_ITERATIONS:
+            print(f"Max iterations {MAX_SEARCH_ITERATIONS} reached. Stopping.")
             print(f"Current queue size: {len(queue)}")
             break
 
         if iters % 100 == 0:
             print(f"Iter {iters}: Queue size {len(queue)}")
+            if cancel_event is not None and cancel_event.is_set():
+                print(f"Search stopped after {iters} iterations.")
+                return
 
             
-        (turns, dist, _), curr_node, visited_mask = heapq.heappop(queue)
+        turns, handle = queue.pop()
+        curr_id = state_node[handle]
+        dist = state_dist[handle]
+        in_edge = state_edge[handle]
+        visited_mask = state_masks[handle]
+        state_masks[handle] = None  # Popped states are never revisited; let the mask go
         
         # Periodic status print
         # Periodic status print
         # if iters % 1 == 0:
         #    print(f"Iter {iters}: Queue size {len(queue)}, Current dist {dist:.1f}, Turns {turns}")
 
+        if handle in evicted:
+            evicted.remove(handle)
+            continue  # Dominated after it was queued
+
         if dist > max_path_length:
             continue
 
         # Detect loops when current node exists in visited mask
-        if (visited_mask & (1 << curr_node.id)) and (dist >= min_path_length):
-            # print(f"Iter {iters}: Loop detected at node {curr_node.id} traverse:")
-            # print(curr_node.traverse())
-            path_segment, loop_start = curr_node.traverse_to(curr_node.id)
-            if not path_segment or not loop_start:
+        if (visited_mask >> curr_id) & 1 and (dist >= min_path_length):
+            # print(f"Iter {iters}: Loop detected at node {curr_id} traverse:")
+            # print(pool.traverse(handle))
+
+            # Check path uniqueness (path_masks may have grown since this was queued)
+            if visited_mask in path_masks:
+                # print(f"Iter {iters}: Path mask duplicate")
+                continue
+
+            loop_start = pool.find_ancestor(handle, curr_id)
+            if loop_start < 0:
                 # print(f"Iter {iters}: Loop detected but reconstruction failed")
                 continue
 
-            loop_dist = dist - loop_start.dist
-            # print(f"Loop dist: {loop_dist:.1f}m, dist: {dist:.1f}m, loop_start.dist: {loop_start.dist:.1f}m")
+            loop_start_dist = state_dist[loop_start]
+            loop_dist = dist - loop_start_dist
+            # print(f"Loop dist: {loop_dist:.1f}m, dist: {dist:.1f}m, loop_start_dist: {loop_start_dist:.1f}m")
             if loop_dist < min_loop_length:
                 # print(f"Iter {iters}: Loop too short ({loop_dist:.1f}m < {min_loop_length}m)")
                 continue
 
-            total_dist = 2 * loop_start.dist + loop_dist
+            total_dist = 2 * loop_start_dist + loop_dist
+            if total_dist > max_path_length:
+                continue
             loop_ratio = loop_dist / total_dist
             
             if loop_ratio < loop_ratio_floor:
                 # print(f"Iter {iters}: Loop ratio too low ({loop_ratio:.2f})")
                 continue
 
-            # Check path uniqueness
-            if visited_mask in path_masks:
-                # print(f"Iter {iters}: Path mask duplicate")
+            fingerprint = (start_node, pool.segment_hash(handle, loop_start))
+            if fingerprint in loop_fingerprints:
+                # print(f"Iter {iters}: Loop already seen (mirrored or re-entered)")
                 continue
+            loop_fingerprints.add(fingerprint)
 
-            centroid = None
-            out_back_section = loop_start.traverse() 
-            path = out_back_section + path_segment + out_back_section[::-1] 
+            full_path = pool.traverse(handle)
+            loop_start_depth = state_depth[loop_start]
+            out_back_section = full_path[:loop_start_depth + 1]
+            path_segment = full_path[loop_start_depth:]
+            path = local.to_global(out_back_section + path_segment + out_back_section[::-1])
             # print(f"Path: {path}")
-            if deduplication == 'centroid':
-                centroid = _calculate_path_centroid(G, path)
-                if _is_centroid_too_close(centroid, existing_centroids, min_dist_m=min_dist_m):
-                    # print(f"Iter {iters}: Centroid too close")
+            yield turns, visited_mask, path, loop_dist, total_dist, loop_ratio, fingerprint
+            continue
+
+        # Expand to neighbors
+        u = curr_id
+        new_mask = visited_mask | (1 << u)
+        prev_id = state_node[state_parent[handle]] if in_edge >= 0 else -1
+        # turn_flags[turn_base + e] says whether in_edge -> e is a turn
+        turn_base = turn_offsets[in_edge] - offsets[u] if in_edge >= 0 else None
+        
+        for e in range(offsets[u], offsets[u + 1]):
+            neighbor = targets[e]
+            if neighbor == prev_id:
+                continue  # Skip immediate backtracking
+
+            new_dist = dist + lengths[e]
+            if new_dist + return_dist[neighbor] > max_path_length:
+                continue  # Can't get back to the start within budget
+            if turn_base is None:
+                new_turns = 0
+            else:
+                new_turns = turns + turn_flags[turn_base + e]
+            if (new_mask >> neighbor) & 1 and new_dist >= min_path_length:
+                # Closes a loop. Its start lies at least start_dist[neighbor] along the
+                # path, which bounds loop length, total and ratio without walking it.
+                start_lb = start_dist[neighbor]
+                if (new_dist - start_lb < min_loop_length
+                        or new_dist + start_lb > max_path_length
+                        or (new_dist - start_lb) < loop_ratio_floor * (new_dist + start_lb)
+                        or new_mask in path_masks):
                     continue
-            elif deduplication == 'jaccard':
-                 if not _is_unique_path(visited_mask, path_masks, similarity_ceiling):
-                    # print(f"Iter {iters}: Jaccard overlap too high")
+
+            # Loop-closing labels are terminal, so only expanding labels compete. The
+            # dominance check comes first so rejected labels never take a pool slot.
+            bucket = None
+            if max_labels and not (new_mask >> neighbor) & 1:
+                bucket = labels.get(e)
+                if bucket is None:
+                    bucket = labels[e] = []
+                if not _admit_label(bucket, new_turns, new_dist, new_mask, max_labels, evicted):
                     continue
 
-            # Yield valid path
-            # print(f"Iter {iters}: **Yielding valid path** (Turns: {turns}, Dist: {dist:.1f}m)")
-            
-            total_miles = total_dist * MILES_PER_METER
-            elev_profile, climb_ft, _ = compute_elevation_profile(G, path)
-            difficulty = compute_difficulty(total_miles, climb_ft)
-            properties = _create_properties(turns, visited_mask, loop_ratio, loop_dist, total_dist, path, climb_ft, difficulty, elev_profile, centroid)
-            geojson_feature = path_to_geojson(G, path, properties)
-            
-            if geojson_feature:
+            new_handle = add_state(neighbor, handle, new_dist, e, new_mask, edge_hashes[e])
+            if bucket is not None:
+                bucket[-1] = (new_turns, new_dist, new_mask, new_handle)
+            queue.push(new_turns, new_dist, new_handle)
+
+def _enrich_loop(
+    G: nx.MultiDiGraph,
+    candidate: Tuple[int, int, List[int], float, float, float, Tuple[int, int]],
+    centroid: Optional[Tuple[float, float]],
+    edge_samples: Optional[EdgeSamples] = None,
+    summary: bool = False,
+    edge_geometry: Optional[EdgeGeometry] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Builds the GeoJSON feature (elevation, difficulty, properties) for an
+    accepted candidate. With edge_samples, climb and centroid are sums over
+    the route's edges. edge_geometry is passed on to path_to_geojson, and
+    its features carry the node path as 'nodes'.
+
+    summary (which needs edge_samples) builds a route summary instead: no
+    elevation profile and, with edge_geometry, geometry simplified to
+    SUMMARY_TOLERANCE_M. The feature is marked details_pending and carries
+    'nodes', for fetching the details later.
+    """
+    turns, _, path, loop_dist, total_dist, loop_ratio, _ = candidate
+    total_miles = total_dist * MILES_PER_METER
+    summary = summary and edge_samples is not None
+    elev_profile = []
+    if edge_samples is not None:
+        _, climb_m, _, route_centroid = edge_samples.path_stats(path)
+        climb_ft = round(climb_m * FEET_PER_METER, 0)
+        if centroid is None:
+            centroid = route_centroid
+        if not summary:
+            elev_profile, _, _ = compute_elevation_profile(G, path, edge_samples=edge_samples)
+    else:
+        elev_profile, climb_ft, _ = compute_elevation_profile(G, path)
+    difficulty = compute_difficulty(total_miles, climb_ft)
+    global_mask = 0
+    for node in set(path):
+        global_mask |= 1 << node
+    properties = _create_properties(turns, global_mask, loop_ratio, loop_dist, total_dist, path, climb_ft, difficulty, elev_profile, centroid)
+    feature = path_to_geojson(G, path, properties, edge_geometry, SUMMARY_TOLERANCE_M if summary else 0.0)
+    if summary and feature:
+        properties['details_pending'] = True
+    if feature and (summary or edge_geometry is not None):
+        feature['nodes'] = path
+    return feature
+
+class _EitherEvent:
+    """Cancellation signal that is set once any of the given events is."""
+    __slots__ = ['events']
+
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self) -> bool:
+        return any(event.is_set() for event in self.events)
+
+def _emit_loops(
+    G: nx.MultiDiGraph,
+    candidates,
+    similarity_ceiling: float,
+    deduplication: str,
+    min_dist_m: float,
+    path_masks: Set[int],
+    stop: threading.Event,
+    edge_samples: Optional[EdgeSamples] = None,
+    summary: bool = False,
+    edge_geometry: Optional[EdgeGeometry] = None
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Applies centroid/Jaccard dedup to loop candidates from _search_loops and
+    yields the survivors as GeoJSON features. Accepted masks go into
+    path_masks, which the search also reads.
+
+    Pipelined so the search never waits on enrichment: a search thread pulls
+    candidates and makes each dedup decision in order (the search depends on
+    them), then hands accepted loops to a thread pool for elevation,
+    properties and GeoJSON. Features are yielded in acceptance order, so
+    output and dedup match a sequential run exactly. Sets stop when closed
+    or finished; the candidates producer must watch it.
+    """
+    centroid_index = CentroidIndex(min_dist_m)
+    jaccard_index = MinHashIndex(similarity_ceiling) if deduplication == 'jaccard' else None
+    ready = queue.Queue(maxsize=PIPELINE_DEPTH)  # Enrichment futures, in acceptance order
+    executor = ThreadPoolExecutor(max_workers=ENRICH_WORKERS, thread_name_prefix='enrich')
+
+    def publish(item) -> bool:
+        # Blocks while the consumer is behind; gives up once it has stopped
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=PIPELINE_POLL_S)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def search_stage():
+        try:
+            for candidate in candidates:
+                turns, visited_mask, path = candidate[:3]
+                centroid = None
+                if deduplication == 'centroid':
+                    centroid = _calculate_path_centroid(G, path, edge_samples)
+                    if centroid_index.too_close(centroid):
+                        # print(f"Centroid too close")
+                        continue
+                elif jaccard_index is not None:
+                    if not jaccard_index.is_unique(visited_mask, path):
+                        # print(f"Jaccard overlap too high")
+                        continue
+
+                # print(f"**Accepted path** (Turns: {turns}, Dist: {candidate[4]:.1f}m)")
                 path_masks.add(visited_mask)
                 if centroid:
-                    existing_centroids.append(centroid)
+                    centroid_index.add(centroid)
+                if jaccard_index is not None:
+                    jaccard_index.add(visited_mask, path)
+                if not publish(executor.submit(_enrich_loop, G, candidate, centroid, edge_samples, summary, edge_geometry)):
+                    return
+        except Exception as e:
+            publish(e)
+            return
+        publish(_PIPELINE_DONE)
+
+    search_thread = threading.Thread(target=search_stage, name='loop-search', daemon=True)
+    search_thread.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is _PIPELINE_DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            geojson_feature = item.result()
+            if geojson_feature:
                 yield geojson_feature
+    finally:
+        stop.set()
+        search_thread.join()
+        executor.shutdown(wait=False, cancel_futures=True)
 
-            continue
-
-        # Expand to neighbors
-        new_mask = visited_mask | (1 << curr_node.id)
-        
-        for neighbor in G.neighbors(curr_node.id):
-            if neighbor == getattr(curr_node.prev, 'id', None):
-                continue  # Skip immediate backtracking
+def find_paths_turns_dist(
+    G: nx.MultiDiGraph,
+    start_node: int,
+    min_path_length: float,
+    max_path_length: float,
+    loop_ratio_floor: float,
+    similarity_ceiling: float,
+    min_loop_length: float = MIN_LOOP_LENGTH_METERS,
+    deduplication: str = 'centroid',
+    min_dist_m: float = 50.0,
+    snapshot: Optional[GraphSnapshot] = None,
+    max_labels: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+    edge_samples: Optional[EdgeSamples] = None,
+    summary: bool = False,
+    edge_geometry: Optional[EdgeGeometry] = None
+) -> Generator[Dict[str, Any], None, None]:
+    """Yields unique loop paths meeting criteria using optimized Dijkstra-like search.
+    The search walks the CSR snapshot; G is only used to enrich accepted loops
+    (via edge_samples when given). max_labels enables label-setting mode: at
+    most that many non-dominated labels are kept per (node, incoming edge)
+    state. Setting cancel_event stops the search within a hundred iterations.
+    summary yields route summaries (see _enrich_loop); edge_geometry
+    gives features pre-encoded geometry (see path_to_geojson). With
+    snapshot, edge_samples and edge_geometry all given, G is not read and
+    may be None."""
+    if snapshot is None:
+        snapshot = GraphSnapshot.from_graph(G)
+
+    # Every node of a route within max_path_length lies within half of it from the
+    # start, so search a densely relabelled neighbourhood (start is local node 0).
+    local = snapshot.extract_local(start_node, max_path_length / 2)
+    # print(f"Local search graph: {local.num_nodes}/{snapshot.num_nodes} nodes")
+    path_masks: Set[int] = set()
+    # Canonical loop fingerprints (start node, hash of the loop's undirected edge set):
+    # mirrored and re-entered copies of a loop share one
+    loop_fingerprints: Set[Tuple[int, int]] = set()
 
-            new_turns, new_dist = weight_function_turns_dist(G, curr_node, neighbor, turns, dist)
-            tiebreaker = neighbor  # Ensures heap can compare elements
-            new_node = PathNode(neighbor, curr_node, new_dist)
-            
-            heapq.heappush(queue, (
-                (new_turns, new_dist, tiebreaker),
-                new_node,
-                new_mask
-            ))
+    stop = threading.Event()  # Set once the consumer stops pulling paths
+    candidates = _search_loops(
+        local, start_node, min_path_length, max_path_length, loop_ratio_floor, min_loop_length,
+        path_masks, loop_fingerprints, max_labels, _EitherEvent(cancel_event, stop)
+    )
+    yield from _emit_loops(G, candidates, similarity_ceiling, deduplication, min_dist_m, path_masks, stop, edge_samples, summary, edge_geometry)
 
 def find_paths(
     G: nx.MultiDiGraph,
@@ -529,8 +782,14 @@ def find_paths(
     min_loop_length: float = MIN_LOOP_LENGTH_METERS,
     algorithm: str = 'turn',
     deduplication: str = 'centroid',
-    min_dist_m: float = 50.0
+    min_dist_m: float = 50.0,
+    snapshot: Optional[GraphSnapshot] = None,
+    max_labels: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+    edge_samples: Optional[EdgeSamples] = None,
+    summary: bool = False,
+    edge_geometry: Optional[EdgeGeometry] = None
 ) -> Generator[Dict[str, Any], None, None]:
     """Dispatcher for path finding algorithms."""
     # Algorithm parameter is ignored as we use turn-only
-    return find_paths_turns_dist(G, start_node, min_path_length, max_path_length, loop_ratio_floor, similarity_ceiling, min_loop_length, deduplication, min_dist_m)
+    return find_paths_turns_dist(G, start_node, min_path_length, max_path_length, loop_ratio_floor, similarity_ceiling, min_loop_length, deduplication, min_dist_m, snapshot, max_labels, cancel_event, edge_samples, summary, edge_geometry)
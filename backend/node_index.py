@@ -0,0 +1,82 @@
+import math
+import threading
+from typing import Sequence, Tuple
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+from dedup_index import METERS_PER_DEGREE
+
+STRTREE_BYTES_PER_NODE = 120  # Rough cost of a node's point geometry and tree entry
+
+
+class NodeIndex:
+    """
+    Nearest-node lookups for one graph: a KD-tree over its nodes in local
+    metres (equirectangular about the centre of the graph's bounding box,
+    so longitude is scaled by cos(lat0); distances are good to well under a
+    percent across a city-sized graph). Built once per graph and cached
+    with it (see GraphCache); a lookup is a tree descent, a few
+    microseconds, and many points snap in one vectorized query.
+
+    Region queries (nodes in a polygon, nodes within a distance of a line)
+    go through a shapely STRtree over the same projected points, built on
+    the first such query. The projection is affine, so a polygon contains
+    the same nodes in local metres as in degrees, and distances are metres.
+    """
+
+    def __init__(self, node_x: np.ndarray, node_y: np.ndarray):
+        self.lat0 = (float(node_y.min()) + float(node_y.max())) / 2 if len(node_y) else 0.0
+        self.lng0 = (float(node_x.min()) + float(node_x.max())) / 2 if len(node_x) else 0.0
+        self.m_per_deg_lng = METERS_PER_DEGREE * math.cos(math.radians(self.lat0))
+        self._points = self.project(node_y, node_x)
+        self._tree = cKDTree(self._points)
+        self._strtree = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_snapshot(cls, snapshot) -> 'NodeIndex':
+        return cls(np.asarray(snapshot.node_x), np.asarray(snapshot.node_y))
+
+    @property
+    def nbytes(self) -> int:
+        # Projected points, plus the KD-tree's copy of them and its index array
+        nbytes = 2 * self._points.nbytes + self._points.shape[0] * 8
+        if self._strtree is not None:
+            nbytes += STRTREE_BYTES_PER_NODE * self._points.shape[0]
+        return nbytes
+
+    def project(self, lat, lng) -> np.ndarray:
+        """(n, 2) local metres (east, north) of coordinate arrays."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        return np.column_stack([(lng - self.lng0) * self.m_per_deg_lng, (lat - self.lat0) * METERS_PER_DEGREE])
+
+    def nearest(self, lat: float, lng: float) -> int:
+        """Id of the node closest to (lat, lng)."""
+        x = (lng - self.lng0) * self.m_per_deg_lng
+        y = (lat - self.lat0) * METERS_PER_DEGREE
+        _, node = self._tree.query((x, y))
+        return int(node)
+
+    def nearest_many(self, lat: Sequence[float], lng: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest node ids and their distances in metres for arrays of coordinates."""
+        dist, nodes = self._tree.query(self.project(lat, lng))
+        return nodes.astype(np.int64), dist
+
+    def _region_tree(self) -> shapely.STRtree:
+        if self._strtree is None:
+            with self._lock:
+                if self._strtree is None:
+                    self._strtree = shapely.STRtree(shapely.points(self._points))
+        return self._strtree
+
+    def nodes_in_polygon(self, lat: Sequence[float], lng: Sequence[float]) -> np.ndarray:
+        """Sorted ids of the nodes inside or on the polygon with these vertices."""
+        polygon = shapely.polygons(self.project(lat, lng))
+        return np.sort(self._region_tree().query(polygon, predicate='intersects'))
+
+    def nodes_near_line(self, lat: Sequence[float], lng: Sequence[float], distance_m: float) -> np.ndarray:
+        """Sorted ids of the nodes within distance_m metres of the polyline with these vertices."""
+        points = self.project(lat, lng)
+        line = shapely.linestrings(points) if len(points) > 1 else shapely.points(points[0])
+        return np.sort(self._region_tree().query(line, predicate='dwithin', distance=distance_m))
@@ -0,0 +1,47 @@
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+MAX_CACHED_PATH_SETS = 8  # Per connection; older summary path sets can no longer serve details
+
+
+class PathSetCache:
+    """
+    What GET_PATH_DETAILS needs for a connection's summary path sets: the
+    graph data each set was generated on (graph, edge samples, edge
+    geometry) and the node path of every route, by path_index.
+
+    Holds the max_path_sets most recently used sets; adding or reading a
+    set marks it used, and the least recently used one is evicted. A set's
+    graph data stays alive while it is cached, even after a graph switch.
+    """
+
+    def __init__(self, max_path_sets: int = MAX_CACHED_PATH_SETS):
+        self.max_path_sets = max_path_sets
+        self._sets: 'OrderedDict[str, Tuple[Any, Any, Any, List[List[int]]]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def add_path_set(self, path_set_id: str, G, edge_samples, edge_geometry):
+        self._sets[path_set_id] = (G, edge_samples, edge_geometry, [])
+        self._sets.move_to_end(path_set_id)
+        while len(self._sets) > self.max_path_sets:
+            self._sets.popitem(last=False)
+
+    def add_path(self, path_set_id: str, nodes: List[int]) -> Optional[int]:
+        """Stores a route's node path; returns its path_index, or None if the set is not cached."""
+        entry = self._sets.get(path_set_id)
+        if entry is None:
+            return None
+        paths = entry[3]
+        paths.append(nodes)
+        return len(paths) - 1
+
+    def get(self, path_set_id: str, path_index: int) -> Optional[Tuple[Any, Any, Any, List[int]]]:
+        """(G, edge_samples, edge_geometry, nodes) of one route, or None if unknown or evicted."""
+        entry = self._sets.get(path_set_id)
+        if entry is None or not isinstance(path_index, int) or not 0 <= path_index < len(entry[3]):
+            return None
+        self._sets.move_to_end(path_set_id)
+        G, edge_samples, edge_geometry, paths = entry
+        return G, edge_samples, edge_geometry, paths[path_index]
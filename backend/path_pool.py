@@ -0,0 +1,82 @@
+from array import array
+from typing import List
+
+HASH_MASK = (1 << 64) - 1
+
+
+class PathPool:
+    """
+    Parent-pointer store for search states, replacing chains of PathNode objects.
+
+    Each state is an integer handle indexing flat typed arrays (node id, parent
+    handle, dist, incoming edge, depth, edge hash sum), so a queued state costs a
+    few dozen bytes instead of several Python objects. Turns live only in the
+    queue, which orders by them. Visited masks stay Python ints in a list,
+    shared between siblings. Handles are never reused within a search.
+
+    edge_sum is the running sum (mod 2**64) of the edge hashes along the path,
+    so the edge multiset between a state and any ancestor hashes to the
+    difference of their sums, independent of direction and order.
+    """
+    __slots__ = ['node', 'parent', 'dist', 'edge', 'depth', 'edge_sum', 'masks']
+
+    def __init__(self):
+        self.node = array('i')
+        self.parent = array('i')  # -1 for the start state
+        self.dist = array('d')
+        self.edge = array('i')  # Edge slot used to reach the node (-1 at start)
+        self.depth = array('i')  # Number of edges from the start
+        self.edge_sum = array('Q')
+        self.masks = []
+
+    def __len__(self) -> int:
+        return len(self.node)
+
+    def add(self, node: int, parent: int, dist: float, edge: int, mask: int, edge_hash: int = 0) -> int:
+        """Appends a state reached over an edge hashing to edge_hash and returns its handle."""
+        handle = len(self.node)
+        self.node.append(node)
+        self.parent.append(parent)
+        self.dist.append(dist)
+        self.edge.append(edge)
+        if parent >= 0:
+            self.depth.append(self.depth[parent] + 1)
+            self.edge_sum.append((self.edge_sum[parent] + edge_hash) & HASH_MASK)
+        else:
+            self.depth.append(0)
+            self.edge_sum.append(0)
+        self.masks.append(mask)
+        return handle
+
+    def traverse(self, handle: int) -> List[int]:
+        """Reconstructs the node path from the start to this state."""
+        node, parent = self.node, self.parent
+        path = [0] * (self.depth[handle] + 1)
+        for i in range(len(path) - 1, -1, -1):
+            path[i] = node[handle]
+            handle = parent[handle]
+        return path
+
+    def find_ancestor(self, handle: int, target_id: int) -> int:
+        """
+        Returns the handle of the nearest earlier state on this state's path at
+        target_id, or -1. Follows parent pointers only, so rejecting a loop
+        candidate never builds a list. Used for loop detection.
+
+        This is a walk over the closed loop, not a constant-time lookup: a
+        per-state map from node to first-visit depth would cost far more than
+        the few dozen bytes a state takes here. The search only calls it for
+        popped states that survived the push-time bounds, and the walks are
+        short (about 8 steps on average on the Ann Arbor graph).
+        """
+        node, parent = self.node, self.parent
+        handle = parent[handle]
+        while handle >= 0:
+            if node[handle] == target_id:
+                return handle
+            handle = parent[handle]
+        return -1
+
+    def segment_hash(self, handle: int, ancestor: int) -> int:
+        """Order- and direction-independent hash of the edges from ancestor to handle."""
+        return (self.edge_sum[handle] - self.edge_sum[ancestor]) & HASH_MASK
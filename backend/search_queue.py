@@ -0,0 +1,86 @@
+import heapq
+from array import array
+
+DIST_RESOLUTION_M = 1.0  # Width of the distance slots that share one heap entry
+
+
+class BucketQueue:
+    """
+    Two-level radix priority queue for the loop search, keyed on
+    (turns, dist, node id, handle).
+
+    The primary key is a small integer turn count, so there is one level per
+    turn count and pop() scans up from the lowest non-empty one. Within a
+    level, states are grouped into DIST_RESOLUTION_M-wide distance slots: a
+    heap orders the occupied slot numbers and each slot is an array('I') of
+    state handles. A queued state therefore costs about 4 bytes.
+
+    Slots only batch the heap; they don't coarsen the order. The first pop
+    from a slot sorts its handles by exact (dist, node id, handle), looked up
+    in the state_dist and state_node arrays, and later pushes into that slot
+    are inserted in place. States therefore pop in exact distance order,
+    ties going to the lower node id and then to the earlier push, the same
+    order as a heap of ((turns, dist, node), ...) entries. Handles must be
+    in both arrays before they are pushed.
+    """
+    __slots__ = ['_levels', '_min', '_size', '_dist', '_node']
+
+    def __init__(self, state_dist, state_node):
+        self._levels = []  # turns -> (heap of slot numbers, {slot: array of handles}, set of sorted slots)
+        self._min = 0  # No level below this index holds entries
+        self._size = 0
+        self._dist = state_dist
+        self._node = state_node
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _key(self, handle: int):
+        return self._dist[handle], self._node[handle], handle
+
+    def push(self, turns: int, dist: float, handle: int):
+        levels = self._levels
+        while len(levels) <= turns:
+            levels.append(([], {}, set()))
+        slot_heap, slots, sorted_slots = levels[turns]
+        slot = int(dist / DIST_RESOLUTION_M)
+        handles = slots.get(slot)
+        if handles is None:
+            handles = slots[slot] = array('I')
+            heapq.heappush(slot_heap, slot)
+        if slot in sorted_slots:
+            # Sorted slots hold handles largest key first, so pop() takes the smallest
+            key = self._key(handle)
+            i = 0
+            while i < len(handles) and self._key(handles[i]) > key:
+                i += 1
+            handles.insert(i, handle)
+        else:
+            handles.append(handle)
+        if turns < self._min:
+            self._min = turns
+        self._size += 1
+
+    def pop(self):
+        """Removes and returns (turns, handle) for the state with the smallest key."""
+        if not self._size:
+            raise IndexError("pop from empty BucketQueue")
+        levels = self._levels
+        turns = self._min
+        while not levels[turns][0]:
+            turns += 1
+        self._min = turns
+        slot_heap, slots, sorted_slots = levels[turns]
+        slot = slot_heap[0]
+        handles = slots[slot]
+        if slot not in sorted_slots:
+            if len(handles) > 1:
+                handles = slots[slot] = array('I', sorted(handles, key=self._key, reverse=True))
+            sorted_slots.add(slot)
+        handle = handles.pop()
+        if not handles:
+            heapq.heappop(slot_heap)
+            del slots[slot]
+            sorted_slots.discard(slot)
+        self._size -= 1
+        return turns, handle
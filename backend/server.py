@@ -1,25 +1,52 @@
 import asyncio
+import concurrent.futures
+import threading
 import websockets
 import json
 import uuid
 import os
+import numpy as np
 from graph_manager import GraphManager
-from loop_generator import find_paths
+from edge_geometry import SUMMARY_TOLERANCE_M
+from loop_generator import compute_elevation_profile, find_paths
+from path_cache import PathSetCache
+import wire
 
 # Configuration
 PORT = 8765
 GRAPHS_DIR = os.path.join(os.path.dirname(__file__), "graphs")
 DEFAULT_GRAPH = "avl_20mi"
+RESULT_QUEUE_SIZE = 8  # Paths buffered between the search thread and the websocket
+SEARCH_THREADS = 4  # Searches run at once across all clients; further ones wait for a free thread
+GRAPH_CACHE_BYTES = 2 * 1024 ** 3  # Estimated memory for loaded graphs; least recently used ones are evicted past it
+
+_GENERATION_DONE = object()  # Sentinel the search thread sends when it finishes
+
+# Searches get their own threads, so long ones never hold up the default executor
+# that path details, routing and graph creation run on
+_search_executor = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix='search')
 
 # Shared graph manager (singleton)
 gm = GraphManager()
 gm.set_graphs_dir(GRAPHS_DIR)
+gm.set_cache_budget(GRAPH_CACHE_BYTES)
+default_graph = None  # Handle on the graph new connections start on, set in main()
 
 async def handler(websocket):
     print(f"Client connected")
-    
+
+    # This client's graph, until it switches: a handle of its own, so switching never affects other clients
+    graph = default_graph.acquire() if default_graph is not None else None
+
     # Send available graphs list on connect
-    await send_graphs_list(websocket)
+    await send_graphs_list(websocket, graph)
+
+    # Generations running for this client: pathSetId -> (task, cancel event)
+    generations = {}
+    # Summary path sets, for serving route details on demand
+    path_cache = PathSetCache()
+    # Encoding of PATH_RECEIVED, agreed through HELLO; clients that never send it get JSON
+    wire_format = wire.JSON_FORMAT
     
     try:
         async for message in websocket:
@@ -28,20 +55,30 @@ async def handler(websocket):
                 msg_type = data.get("type")
                 print(f"Received: {msg_type} {data}")
 
-                if msg_type == "START_GENERATION":
-                    await handle_start_generation(websocket, data)
+                if msg_type == "HELLO":
+                    wire_format = wire.negotiate(data.get("formats") or [])
+                    await websocket.send(json.dumps({
+                        "type": "WIRE_FORMAT",
+                        "format": wire_format
+                    }))
+                elif msg_type == "START_GENERATION":
+                    await handle_start_generation(websocket, data, graph, generations, path_cache, wire_format)
+                elif msg_type == "CANCEL_GENERATION":
+                    handle_cancel_generation(data, generations)
+                elif msg_type == "GET_PATH_DETAILS":
+                    await handle_get_path_details(websocket, data, path_cache)
                 elif msg_type == "GET_NODES_IN_REGION":
-                    await handle_get_nodes_in_region(websocket, data)
+                    await handle_get_nodes_in_region(websocket, data, graph)
                 elif msg_type == "GET_NODES_NEAR_POLYLINE":
-                    await handle_get_nodes_near_polyline(websocket, data)
+                    await handle_get_nodes_near_polyline(websocket, data, graph)
                 elif msg_type == "LIST_GRAPHS":
-                    await send_graphs_list(websocket)
+                    await send_graphs_list(websocket, graph)
                 elif msg_type == "SWITCH_GRAPH":
-                    await handle_switch_graph(websocket, data)
+                    graph = await handle_switch_graph(websocket, data, graph)
                 elif msg_type == "CREATE_GRAPH":
-                    await handle_create_graph(websocket, data)
+                    graph = await handle_create_graph(websocket, data, graph)
                 elif msg_type == "GET_GRAPH_NODES":
-                    await handle_get_graph_nodes(websocket, data)
+                    await handle_get_graph_nodes(websocket, data, graph)
                 else:
                     print(f"Unknown message type: {msg_type}")
 
@@ -54,11 +91,17 @@ async def handler(websocket):
 
     except websockets.exceptions.ConnectionClosed:
         print("Client disconnected")
-
-async def send_graphs_list(websocket):
-    """Send the list of available graphs to the client."""
+    finally:
+        # Stop any searches still running for this client; they release their own graph handles
+        for _, cancel_event in list(generations.values()):
+            cancel_event.set()
+        if graph is not None:
+            graph.release()
+
+async def send_graphs_list(websocket, graph=None):
+    """Send the list of available graphs to the client, with the client's own graph as active."""
     graphs = GraphManager.list_graphs(GRAPHS_DIR)
-    active = gm.get_active_name()
+    active = graph.name if graph is not None else None
     boundaries = GraphManager.get_graph_boundaries(GRAPHS_DIR)
     await websocket.send(json.dumps({
         "type": "GRAPHS_LIST",
@@ -67,13 +110,20 @@ async def send_graphs_list(websocket):
         "boundaries": boundaries
     }))
 
-async def handle_switch_graph(websocket, data):
-    """Switch to a different graph."""
+def _switch_graph(graph, name):
+    """Opens graph name for a client and releases the client's previous handle; returns the new handle."""
+    new_graph = gm.open_graph(name)
+    if graph is not None:
+        graph.release()
+    return new_graph
+
+async def handle_switch_graph(websocket, data, graph):
+    """Switches this client to a different graph; returns the client's graph handle."""
     name = data.get("name")
     if not name:
-        return
+        return graph
     try:
-        gm.switch_graph(name)
+        graph = _switch_graph(graph, name)
         await websocket.send(json.dumps({
             "type": "GRAPH_SWITCHED",
             "name": name
@@ -84,9 +134,13 @@ async def handle_switch_graph(websocket, data):
             "type": "GRAPH_CREATE_ERROR",
             "error": str(e)
         }))
+    return graph
 
-async def handle_create_graph(websocket, data):
-    """Create a new graph from bounding box or polygon coordinates."""
+async def handle_create_graph(websocket, data, graph):
+    """
+    Create a new graph from bounding box or polygon coordinates and switch
+    this client to it; returns the client's graph handle.
+    """
     name = data.get("name")
     boundary_type = data.get("boundary_type", "box")
     # custom_filter = data.get("filter", '["highway"~"trunk|primary|secondary|tertiary"]')
@@ -97,7 +151,7 @@ async def handle_create_graph(websocket, data):
             "type": "GRAPH_CREATE_ERROR",
             "error": "Missing required field: name"
         }))
-        return
+        return graph
 
     # Validate based on boundary type
     if boundary_type == "polygon":
@@ -107,7 +161,7 @@ async def handle_create_graph(websocket, data):
                 "type": "GRAPH_CREATE_ERROR",
                 "error": "Polygon requires at least 3 coordinate pairs"
             }))
-            return
+            return graph
     elif boundary_type == "circle":
         center_lat = data.get("center_lat")
         center_lng = data.get("center_lng")
@@ -117,7 +171,7 @@ async def handle_create_graph(websocket, data):
                 "type": "GRAPH_CREATE_ERROR",
                 "error": "Circle requires center_lat, center_lng, and positive radius_miles"
             }))
-            return
+            return graph
     else:
         south = data.get("south")
         west = data.get("west")
@@ -128,7 +182,7 @@ async def handle_create_graph(websocket, data):
                 "type": "GRAPH_CREATE_ERROR",
                 "error": "Missing required fields: south, west, north, east"
             }))
-            return
+            return graph
 
     # Notify client that creation has started
     await websocket.send(json.dumps({
@@ -155,7 +209,7 @@ async def handle_create_graph(websocket, data):
             )
 
         # Load the newly created graph
-        gm.switch_graph(name)
+        graph = _switch_graph(graph, name)
 
         await websocket.send(json.dumps({
             "type": "GRAPH_CREATED",
@@ -163,7 +217,7 @@ async def handle_create_graph(websocket, data):
         }))
 
         # Send updated graphs list (includes boundaries)
-        await send_graphs_list(websocket)
+        await send_graphs_list(websocket, graph)
         print(f"Graph '{name}' created and loaded successfully")
 
     except Exception as e:
@@ -173,16 +227,19 @@ async def handle_create_graph(websocket, data):
             "type": "GRAPH_CREATE_ERROR",
             "error": str(e)
         }))
+    return graph
 
-async def handle_start_generation(websocket, data):
+async def handle_start_generation(websocket, data, graph, generations, path_cache, wire_format=wire.JSON_FORMAT):
     lat = data.get("lat")
     lng = data.get("lng")
     
-    if lat is None or lng is None:
+    if lat is None or lng is None or graph is None:
         return
 
+    loaded = graph.graph
+
     # 1. Find nearest node
-    start_node = gm.get_nearest_node(lat, lng)
+    start_node = gm.get_nearest_node(loaded, lat, lng)
     print(f"Start node: {start_node}")
 
     # 2. Create PathSet ID
@@ -196,8 +253,6 @@ async def handle_start_generation(websocket, data):
     }))
 
     # 4. Start generation
-    G = gm.get_graph()
-    
     # Parameters from request with defaults
     min_path_len = (data.get("min_path_len", 2)) * 1609.34 
     max_path_len = (data.get("max_path_len", 50)) * 1609.34
@@ -207,48 +262,186 @@ async def handle_start_generation(websocket, data):
     algorithm = data.get("algorithm", "scenic")
     deduplication = data.get("deduplication", "centroid")
     min_dist_m = float(data.get("min_dist_m") or 50.0)
+    max_labels = int(data.get("max_labels") or 0) or None  # Label-setting mode when set
+    # Summaries leave the profile and full geometry to GET_PATH_DETAILS; stats_only is the older name
+    summary = bool(data.get("summary", data.get("stats_only", False)))
     
-    print(f"Starting generation: {max_paths} paths, Alg: {algorithm}, Dedup: {deduplication}, MinDist: {min_dist_m}m, Range: {min_path_len/1609.34:.1f}-{max_path_len/1609.34:.1f}mi")
-
-    # Run generator
-    count = 0
-
-    for path_geojson in find_paths(
-        G, 
-        start_node, 
-        min_path_len, 
-        max_path_len, 
-        loop_ratio_floor, 
-        similarity_ceiling, 
+    print(f"Starting generation: {max_paths} paths, Alg: {algorithm}, Dedup: {deduplication}, MinDist: {min_dist_m}m, Labels: {max_labels}, Range: {min_path_len/1609.34:.1f}-{max_path_len/1609.34:.1f}mi")
+
+    search_kwargs = dict(
+        G=None,  # Not read: search and enrichment run on the mapped snapshot, samples and geometry
+        start_node=start_node,
+        min_path_length=min_path_len,
+        max_path_length=max_path_len,
+        loop_ratio_floor=loop_ratio_floor,
+        similarity_ceiling=similarity_ceiling,
         min_loop_length=600,
         algorithm=algorithm,
         deduplication=deduplication,
-        min_dist_m=min_dist_m
-    ):
-        response = {
-            "type": "PATH_RECEIVED",
+        min_dist_m=min_dist_m,
+        snapshot=loaded.snapshot,
+        max_labels=max_labels,
+        edge_samples=loaded.edge_samples,
+        summary=summary,
+        edge_geometry=loaded.edge_geometry
+    )
+    if summary:
+        path_cache.add_path_set(path_set_id, None, search_kwargs["edge_samples"], search_kwargs["edge_geometry"])
+
+    # A new search replaces this client's running ones
+    for _, running_event in list(generations.values()):
+        running_event.set()
+
+    # Run the search off the event loop so other messages keep being served. It holds
+    # its own handle, so the graph stays loaded even if this client switches away.
+    search_graph = graph.acquire()
+    cancel_event = threading.Event()
+    task = asyncio.create_task(run_generation(websocket, path_set_id, search_kwargs, max_paths, cancel_event, path_cache, wire_format))
+    generations[path_set_id] = (task, cancel_event)
+    task.add_done_callback(lambda _: generations.pop(path_set_id, None))
+    task.add_done_callback(lambda _: search_graph.release())
+
+def handle_cancel_generation(data, generations):
+    """Stops one running generation (by pathSetId) or all of this client's generations."""
+    path_set_id = data.get("pathSetId")
+    if path_set_id:
+        entry = generations.get(path_set_id)
+        targets = [entry] if entry else []
+    else:
+        targets = list(generations.values())
+    for _, cancel_event in targets:
+        cancel_event.set()
+    print(f"Cancelled {len(targets)} generation(s)")
+
+def _publish_result(loop, results, item, cancel_event) -> bool:
+    """
+    Hands item from the search thread to the event loop, waiting while the
+    queue is full. Returns False if the generation is cancelled first.
+    """
+    future = asyncio.run_coroutine_threadsafe(results.put(item), loop)
+    while True:
+        try:
+            future.result(timeout=0.05)
+            return True
+        except concurrent.futures.TimeoutError:
+            if cancel_event.is_set():
+                future.cancel()
+                return False
+
+def _generate_paths(loop, results, search_kwargs, cancel_event):
+    """Worker-thread body: runs find_paths and streams each path into results."""
+    try:
+        for path_geojson in find_paths(**search_kwargs, cancel_event=cancel_event):
+            if not _publish_result(loop, results, path_geojson, cancel_event):
+                return
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        _publish_result(loop, results, e, cancel_event)
+        return
+    _publish_result(loop, results, _GENERATION_DONE, cancel_event)
+
+async def run_generation(websocket, path_set_id, search_kwargs, max_paths, cancel_event, path_cache=None,
+                         wire_format=wire.JSON_FORMAT):
+    """
+    Streams paths from a worker-thread search to the client until done, full
+    or cancelled. Summary paths get a path_index; their node paths are kept
+    in path_cache for GET_PATH_DETAILS. With the binary wire format, paths
+    go out as wire.encode_path_received frames.
+    """
+    summary = search_kwargs.get("summary", False)
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue(maxsize=RESULT_QUEUE_SIZE)
+    worker = loop.run_in_executor(_search_executor, _generate_paths, loop, results, search_kwargs, cancel_event)
+
+    count = 0
+    cancelled = False
+    try:
+        while True:
+            item = await results.get()
+            if item is _GENERATION_DONE:
+                cancelled = cancel_event.is_set()
+                break
+            if isinstance(item, Exception):
+                print(f"Generation {path_set_id} failed: {item}")
+                break
+
+            nodes = item.pop("nodes", None)
+            if summary and nodes is not None and path_cache is not None:
+                path_index = path_cache.add_path(path_set_id, nodes)
+                if path_index is not None:
+                    item["properties"]["path_index"] = path_index
+
+            response = {
+                "type": "PATH_RECEIVED",
+                "pathSetId": path_set_id,
+                "path": item
+            }
+            if wire_format == wire.BINARY_FORMAT and nodes is not None:
+                tolerance_m = SUMMARY_TOLERANCE_M if summary else 0.0
+                coordinates = search_kwargs["edge_geometry"].path_coordinates(nodes, tolerance_m)
+                await websocket.send(wire.encode_path_received(response, nodes, coordinates))
+            else:
+                # Geometry arrives pre-encoded (wire.RawJSON)
+                await websocket.send(wire.dumps(response))
+
+            count += 1
+            if count >= max_paths:
+                break
+            if cancel_event.is_set():
+                cancelled = True
+                break
+
+        # 5. Complete
+        await websocket.send(json.dumps({
+            "type": "GENERATION_COMPLETE",
             "pathSetId": path_set_id,
-            "path": path_geojson
-        }
-        await websocket.send(json.dumps(response))
-        await asyncio.sleep(0) # Yield control
-        
-        count += 1
-        if count >= max_paths:
-            break
-
-    # 5. Complete
-    await websocket.send(json.dumps({
-        "type": "GENERATION_COMPLETE",
-        "pathSetId": path_set_id
+            "cancelled": cancelled
+        }))
+    except websockets.exceptions.ConnectionClosed:
+        print(f"Client disconnected during generation {path_set_id}")
+    finally:
+        # Stops the search if we are leaving early; returns within milliseconds
+        cancel_event.set()
+        await worker
+
+async def handle_get_path_details(websocket, data, path_cache):
+    """Sends the full geometry and elevation profile of one route from a summary path set."""
+    path_set_id = data.get("pathSetId")
+    path_index = data.get("pathIndex")
+    entry = path_cache.get(path_set_id, path_index)
+    if entry is None:
+        print(f"No stored path {path_index} in path set {path_set_id}")
+        await websocket.send(json.dumps({
+            "type": "PATH_DETAILS_UNAVAILABLE",
+            "pathSetId": path_set_id,
+            "pathIndex": path_index
+        }))
+        return
+
+    G, edge_samples, edge_geometry, nodes = entry
+
+    def details():
+        profile, _, _ = compute_elevation_profile(G, nodes, edge_samples=edge_samples)
+        return profile, edge_geometry.linestring_json(nodes)
+
+    loop = asyncio.get_running_loop()
+    profile, geometry = await loop.run_in_executor(None, details)
+
+    await websocket.send(wire.dumps({
+        "type": "PATH_DETAILS",
+        "pathSetId": path_set_id,
+        "pathIndex": path_index,
+        "geometry": wire.RawJSON(geometry) if geometry else None,
+        "elevationProfile": profile
     }))
 
-async def handle_get_nodes_in_region(websocket, data):
+async def handle_get_nodes_in_region(websocket, data, graph):
     coordinates = data.get("coordinates") # [[lat, lng], ...]
-    if not coordinates:
+    if not coordinates or graph is None:
         return
 
-    nodes = gm.get_nodes_in_polygon(coordinates)
+    nodes = gm.get_nodes_in_polygon(graph.graph, coordinates)
     mask = gm.create_node_mask(nodes)
     print("region path", nodes, mask)
     
@@ -257,64 +450,62 @@ async def handle_get_nodes_in_region(websocket, data):
         "mask": hex(mask)
     }))
 
-async def handle_get_nodes_near_polyline(websocket, data):
+async def handle_get_nodes_near_polyline(websocket, data, graph):
     coordinates = data.get("coordinates") # [[lat, lng], ...]
-    if not coordinates:
+    if not coordinates or graph is None:
         return
 
-    # Use edge-based matching for accurate visualization
-    nodes, edges_geojson = gm.get_edges_near_polyline(coordinates, buffer_meters=25.0)
+    # Use edge-based matching for accurate visualization; routing runs off the event loop
+    loop = asyncio.get_running_loop()
+    nodes, geometry = await loop.run_in_executor(None, gm.get_edges_near_polyline, graph.graph, coordinates, 25.0)
     mask = gm.create_node_mask(nodes)
     
     response = {
         "type": "NODES_ALONG_PATH",
         "mask": hex(mask)
     }
-    if edges_geojson:
-        response["edges"] = edges_geojson
+    if geometry:
+        response["edges"] = {
+            "type": "Feature",
+            "geometry": wire.RawJSON(geometry),
+            "properties": {}
+        }
     
-    await websocket.send(json.dumps(response))
+    await websocket.send(wire.dumps(response))
 
-async def handle_get_graph_nodes(websocket, data):
-    """Returns the coordinates of all nodes in the currently active graph."""
-    try:
-        G = gm.get_graph()
-        nodes = []
-        for node, data in G.nodes(data=True):
-            if 'y' in data and 'x' in data:
-                nodes.append([data['y'], data['x']]) # [lat, lng]
-                
-        await websocket.send(json.dumps({
-            "type": "GRAPH_NODES",
-            "nodes": nodes
-        }))
-    except ValueError:
-        # Graph might not be loaded yet
-        await websocket.send(json.dumps({
-            "type": "GRAPH_NODES",
-            "nodes": []
-        }))
+async def handle_get_graph_nodes(websocket, data, graph):
+    """Returns the coordinates of all nodes in this client's graph."""
+    nodes = []
+    # No graph if none was available when the client connected
+    if graph is not None:
+        snapshot = graph.graph.snapshot
+        nodes = np.column_stack([snapshot.node_y, snapshot.node_x]).tolist()  # [lat, lng]
+
+    await websocket.send(json.dumps({
+        "type": "GRAPH_NODES",
+        "nodes": nodes
+    }))
 
 async def main():
+    global default_graph
     print("Initializing GraphManager...")
     
-    # Load default graph
-    default_path = os.path.join(GRAPHS_DIR, f"{DEFAULT_GRAPH}.gpickle")
-    if os.path.exists(default_path):
-        gm.load_graph(default_path)
+    # Load default graph; the server keeps this handle, so it stays cached for new clients
+    if DEFAULT_GRAPH in GraphManager.list_graphs(GRAPHS_DIR):
+        default_graph = gm.open_graph(DEFAULT_GRAPH)
     else:
-        print(f"Default graph not found: {default_path}")
+        print(f"Default graph not found: {DEFAULT_GRAPH}")
         # Try to load the first available graph
         graphs = GraphManager.list_graphs(GRAPHS_DIR)
         if graphs:
-            gm.switch_graph(graphs[0])
+            default_graph = gm.open_graph(graphs[0])
             print(f"Loaded first available graph: {graphs[0]}")
         else:
             print("No graphs available! Create one through the UI.")
 
     available = GraphManager.list_graphs(GRAPHS_DIR)
     print(f"Available graphs: {available}")
-    print(f"Active graph: {gm.get_active_name()}")
+    print(f"Default graph: {default_graph.name if default_graph is not None else None}")
 
     print(f"Starting WebSocket server on port {PORT}...")
     async with websockets.serve(handler, "localhost", PORT):
@@ -0,0 +1,127 @@
+import json
+import struct
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+
+
+class RawJSON:
+    """Already-encoded JSON text, spliced into a message by dumps as is."""
+    __slots__ = ['text']
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+def dumps(obj: Any) -> str:
+    """
+    json.dumps that writes RawJSON values verbatim. Each one is encoded as a
+    numbered placeholder string first and replaced in the output, so large
+    pre-encoded fragments (route geometry) are never parsed or re-encoded.
+    """
+    raw: List[str] = []
+
+    def default(value):
+        if isinstance(value, RawJSON):
+            raw.append(value.text)
+            return f'\x00raw{len(raw) - 1}'
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    text = json.dumps(obj, default=default)
+    for i, fragment in enumerate(raw):
+        text = text.replace(json.dumps(f'\x00raw{i}'), fragment, 1)
+    return text
+
+
+# Binary framing, negotiated per connection (see negotiate); JSON is the fallback
+BINARY_FORMAT = 'binary-v1'
+JSON_FORMAT = 'json'
+SUPPORTED_FORMATS = (BINARY_FORMAT, JSON_FORMAT)  # In order of preference
+PATH_MAGIC = b'RLP1'  # PATH_RECEIVED frame
+PROFILE_DECIMALS = 6  # Profile lat/lng are sent as integer micro-degrees
+
+
+def negotiate(offered: Sequence[str]) -> str:
+    """The preferred format among those a client offers; JSON if none match."""
+    for fmt in SUPPORTED_FORMATS:
+        if fmt in offered:
+            return fmt
+    return JSON_FORMAT
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    """Maps signed integers to unsigned ones with small magnitudes staying small."""
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _varints(values: np.ndarray) -> bytes:
+    """LEB128 encoding of unsigned integers: 7 bits per byte, high bit set on all but the last."""
+    values = values.astype(np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += values >= np.uint64(1 << (7 * k))
+    # Byte j of value i holds bits 7j..7j+6
+    j = np.arange(int(nbytes.sum()), dtype=np.int64) - np.repeat(np.cumsum(nbytes) - nbytes, nbytes)
+    out = (np.repeat(values, nbytes) >> (7 * j).astype(np.uint64)) & np.uint64(0x7F)
+    out |= np.where(j < np.repeat(nbytes, nbytes) - 1, np.uint64(0x80), np.uint64(0))
+    return out.astype(np.uint8).tobytes()
+
+
+def _padded(data: bytes) -> bytes:
+    """data followed by zeros up to a multiple of 4 bytes, so the next typed array is aligned."""
+    return data + b'\0' * (-len(data) % 4)
+
+
+def encode_path_received(message: Dict[str, Any], nodes: Sequence[int], coordinates: Tuple[np.ndarray, np.ndarray]) -> bytes:
+    """
+    Binary PATH_RECEIVED frame for a message built for JSON. Little-endian
+    throughout; every section starts on a 4-byte boundary:
+
+      magic 'RLP1'
+      uint32 header length, header: the message as UTF-8 JSON, minus the
+        geometry and the 'visited' and 'elevation_profile' properties
+      uint32 point count, uint32 byte count, polyline: zigzag LEB128 varints
+        of the lng, lat deltas (interleaved; the first point is relative
+        to 0) of the quantized coordinates, in micro-degrees
+      uint32 node count, uint32 byte count, visited nodes: LEB128 varints
+        of the deltas of the sorted node ids
+      uint32 profile row count n, then columns dist (Float32, miles),
+        elevation (Float32, feet), lat and lng (Int32, micro-degrees),
+        bearing (Int16, tenths of a degree)
+
+    coordinates are the route's quantized (qx, qy), from
+    EdgeGeometry.path_coordinates.
+    """
+    feature = message['path']
+    properties = dict(feature['properties'])
+    properties.pop('visited', None)
+    profile = properties.pop('elevation_profile', None) or []
+    header = dict(message, path={'type': 'Feature', 'properties': properties})
+    header_bytes = json.dumps(header, separators=(',', ':')).encode()
+
+    qx, qy = coordinates
+    deltas = np.empty(2 * len(qx), dtype=np.int64)
+    deltas[0::2] = np.diff(qx, prepend=0)
+    deltas[1::2] = np.diff(qy, prepend=0)
+    polyline = _varints(_zigzag(deltas))
+
+    visited = np.unique(np.asarray(nodes, dtype=np.int64))
+    node_bytes = _varints(np.diff(visited, prepend=0))
+
+    rows = np.asarray(profile, dtype=np.float64).reshape(-1, 5)
+    scale = 10 ** PROFILE_DECIMALS
+    profile_bytes = b''.join([
+        rows[:, 0].astype('<f4').tobytes(),
+        rows[:, 1].astype('<f4').tobytes(),
+        np.round(rows[:, 2] * scale).astype('<i4').tobytes(),
+        np.round(rows[:, 3] * scale).astype('<i4').tobytes(),
+        np.round(rows[:, 4] * 10).astype('<i2').tobytes(),
+    ])
+
+    return b''.join([
+        PATH_MAGIC,
+        struct.pack('<I', len(header_bytes)), _padded(header_bytes),
+        struct.pack('<II', len(qx), len(polyline)), _padded(polyline),
+        struct.pack('<II', len(visited), len(node_bytes)), _padded(node_bytes),
+        struct.pack('<I', len(rows)), _padded(profile_bytes),
+    ])
@@ -26,6 +26,7 @@ function App() {
     drawnSelections,
     createPathSet,
     addPathToSet,
+    setPathDetails,
     completePathSet,
     selectPathSet,
     addDrawnSelection,
@@ -116,6 +117,17 @@ function App() {
           completePathSet(message.pathSetId);
           break;
 
+        case 'PATH_DETAILS':
+          setPathDetails(message.pathSetId, message.pathIndex, {
+            geometry: message.geometry,
+            elevationProfile: message.elevationProfile
+          });
+          break;
+
+        case 'PATH_DETAILS_UNAVAILABLE':
+          setPathDetails(message.pathSetId, message.pathIndex, null);
+          break;
+
         case 'NODES_IN_REGION':
         case 'NODES_ALONG_PATH': {
           // Pop context to see if it was include or exclude
@@ -207,13 +219,17 @@ function App() {
           setGraphNodes(message.nodes || []);
           break;
 
+        case 'WIRE_FORMAT':
+          console.log('[App] Path encoding:', message.format);
+          break;
+
         default:
           console.log('[App] Unknown message type:', message.type);
       }
     });
 
     return unsubscribe;
-  }, [subscribe, createPathSet, addPathToSet, completePathSet, addDrawnSelection, setMode]);
+  }, [subscribe, createPathSet, addPathToSet, setPathDetails, completePathSet, addDrawnSelection, setMode]);
 
   // Handle map click (in input mode)
   const handleMapClick = useCallback((position) => {
@@ -332,7 +348,8 @@ function App() {
         sendMessage('START_GENERATION', {
           lat: pendingMarker.lat,
           lng: pendingMarker.lng,
-          ...genSettings
+          ...genSettings,
+          summary: true // Profiles and full geometry are fetched when first shown
         });
         localStorage.setItem('lastMapPosition', JSON.stringify({
           center: [pendingMarker.lat, pendingMarker.lng],
@@ -377,11 +394,20 @@ function App() {
         // Backspace: Return to Input Mode
         if (e.key === 'Backspace') {
           console.log('Backspace pressed, returning to input mode');
+          // Leaving the path set: stop its search if it is still running
+          if (activePathSetId && activePathSet && !activePathSet.isComplete) {
+            sendMessage('CANCEL_GENERATION', { pathSetId: activePathSetId });
+          }
           selectPathSet(null);
           setMode('input');
           setActiveTool(null);
         }
 
+        // Escape: stop a generation that is still running
+        if (e.key === 'Escape' && activePathSetId && activePathSet && !activePathSet.isComplete) {
+          sendMessage('CANCEL_GENERATION', { pathSetId: activePathSetId });
+        }
+
         // Arrow keys: page through paths
         if (e.key === 'ArrowRight' || e.key === 'ArrowDown') {
           e.preventDefault();
@@ -436,7 +462,7 @@ function App() {
     return () => {
       window.removeEventListener('keydown', handleKeyDown);
     };
-  }, [mode, pendingMarker, sendMessage, clearPendingMarker, selectPathSet, setMode, undoLastSelection, genSettings, graphBounds, isCreatingGraph, nextPath, prevPath, activeTool, setActiveTool, setIsExcludeMode, setIsElevationMinimized, pathUndoRef, graphCreateMode, handleCreateGraph, exclusionZones, setIsDrawingExclusion]);
+  }, [mode, pendingMarker, sendMessage, activePathSetId, activePathSet, clearPendingMarker, selectPathSet, setMode, undoLastSelection, genSettings, graphBounds, isCreatingGraph, nextPath, prevPath, activeTool, setActiveTool, setIsExcludeMode, setIsElevationMinimized, pathUndoRef, graphCreateMode, handleCreateGraph, exclusionZones, setIsDrawingExclusion]);
 
   // Auto-show elevation window when path with elevation data is selected
   // Auto-show elevation window when path with elevation data is selected
@@ -447,6 +473,20 @@ function App() {
     // So we just don't do anything here. The window shows if !isElevationMinimized and data exists.
   }, [currentPath]);
 
+  // Summary paths arrive with simplified geometry and no elevation profile;
+  // fetch the details once the window or arrows need them
+  const requestedDetails = useRef(new Set());
+  useEffect(() => {
+    const props = currentPath?.properties;
+    if (!props?.details_pending || !activePathSetId) return;
+    if (isElevationMinimized && !showArrows) return;
+
+    const key = `${activePathSetId}:${props.path_index}`;
+    if (requestedDetails.current.has(key)) return;
+    requestedDetails.current.add(key);
+    sendMessage('GET_PATH_DETAILS', { pathSetId: activePathSetId, pathIndex: props.path_index });
+  }, [currentPath, activePathSetId, isElevationMinimized, showArrows, sendMessage]);
+
   // Persist primary color setting
   useEffect(() => {
     localStorage.setItem('primaryColor', primaryColor);
@@ -566,7 +606,7 @@ function App() {
       />
 
       {/* Elevation Window & Toggle */}
-      {currentPath?.properties?.elevation_profile?.length > 1 && (
+      {(currentPath?.properties?.elevation_profile?.length > 1 || currentPath?.properties?.details_pending) && (
         <>
           {/* Minimized toggle button */}
           {isElevationMinimized && (
@@ -582,7 +622,7 @@ function App() {
           {/* Key listener for Toggle is already in handleKeyDown ('e') */}
 
           {/* Main Window */}
-          {!isElevationMinimized && <ElevationProfileWindow
+          {!isElevationMinimized && currentPath.properties.elevation_profile?.length > 1 && <ElevationProfileWindow
             elevationProfile={currentPath.properties.elevation_profile}
             onClose={() => setIsElevationMinimized(true)}
             hoveredPoint={hoveredPoint}
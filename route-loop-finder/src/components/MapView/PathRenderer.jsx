@@ -63,10 +63,12 @@ function PathRenderer({
         opacity: 0.7
     }), []);
 
-    // Generate unique keys for GeoJSON components
+    // Generate unique keys for GeoJSON components. GeoJSON layers ignore new data,
+    // so the key also changes when a summary path's full geometry arrives.
     const getPathKey = (path, index, prefix) => {
-        const visited = path?.properties?.visited || index;
-        return `${prefix}-${visited}-${index}`;
+        const visited = path?.properties?.visited || path?.id || index;
+        const detail = path?.properties?.details_pending ? 'summary' : 'full';
+        return `${prefix}-${visited}-${detail}-${index}`;
     };
 
     // Get style for a selection based on its type
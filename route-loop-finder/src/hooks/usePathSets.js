@@ -83,6 +83,31 @@ export function usePathSets() {
         });
     }, []);
 
+    // Replace a summary path's simplified geometry with the details fetched on demand.
+    // Without details (the server no longer has them) the summary is kept as is.
+    const setPathDetails = useCallback((pathSetId, pathIndex, details) => {
+        setPathSets(prev => {
+            const pathSet = prev[pathSetId];
+            if (!pathSet) return prev;
+
+            const paths = pathSet.paths.map(p => {
+                if (p.properties?.path_index !== pathIndex) return p;
+                const properties = { ...p.properties, details_pending: false };
+                if (!details) return { ...p, properties };
+                return {
+                    ...p,
+                    geometry: details.geometry || p.geometry,
+                    properties: { ...properties, elevation_profile: details.elevationProfile }
+                };
+            });
+
+            return {
+                ...prev,
+                [pathSetId]: { ...pathSet, paths }
+            };
+        });
+    }, []);
+
     // Mark a path set as complete
     const completePathSet = useCallback((pathSetId) => {
         setPathSets(prev => {
@@ -345,6 +370,7 @@ export function usePathSets() {
         // Actions
         createPathSet,
         addPathToSet,
+        setPathDetails,
         completePathSet,
         selectPathSet,
         addDrawnSelection,
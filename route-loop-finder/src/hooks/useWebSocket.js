@@ -1,4 +1,5 @@
 import { useEffect, useRef, useState, useCallback } from 'react';
+import { WIRE_FORMATS, decodeBinaryMessage } from '../utils/wireProtocol';
 
 const RECONNECT_DELAY = 3000;
 
@@ -17,15 +18,20 @@ export function useWebSocket(url = 'ws://localhost:8765') {
     
     setStatus('connecting');
     ws.current = new WebSocket(url);
+    ws.current.binaryType = 'arraybuffer';
 
     ws.current.onopen = () => {
       console.log('[WebSocket] Connected');
       setStatus('connected');
+      // Offer the binary path encoding; the server answers with WIRE_FORMAT
+      ws.current.send(JSON.stringify({ type: 'HELLO', formats: WIRE_FORMATS }));
     };
 
     ws.current.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
+        const data = typeof event.data === 'string'
+          ? JSON.parse(event.data)
+          : decodeBinaryMessage(event.data);
         messageHandlers.current.forEach(handler => handler(data));
       } catch (error) {
         console.error('[WebSocket] Failed to parse message:', error);
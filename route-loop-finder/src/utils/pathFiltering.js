@@ -1,4 +1,5 @@
 /* global BigInt */
+import { visitedMask } from './wireProtocol';
 
 /**
  * Filter paths by distance range.
@@ -30,7 +31,7 @@ export function filterByDifficulty(paths, minDifficulty, maxDifficulty) {
  */
 export function filterBySelection(paths, strictIncludeMasks, looseIncludeMasks, excludeMask) {
     return paths.filter(path => {
-        const visited = BigInt(path.properties?.visited || '0');
+        const visited = visitedMask(path);
 
         // Check exclusion (must not touch any excluded nodes)
         if (excludeMask && excludeMask > BigInt(0)) {
@@ -0,0 +1,135 @@
+/* global BigInt */
+
+/**
+ * Binary wire format for PATH_RECEIVED (see backend/wire.py for the layout).
+ * Formats are offered to the server in HELLO, most preferred first; the
+ * server falls back to JSON for anything it does not support.
+ */
+export const WIRE_FORMATS = ['binary-v1', 'json'];
+
+const PATH_MAGIC = 'RLP1';
+const COORD_SCALE = 1e6; // Coordinates travel as integer micro-degrees
+
+// Reads `count` unsigned LEB128 varints starting at `offset`
+function readVarints(bytes, offset, count) {
+    const values = new Float64Array(count);
+    let pos = offset;
+    for (let i = 0; i < count; i++) {
+        let value = 0;
+        let scale = 1;
+        let byte;
+        do {
+            byte = bytes[pos++];
+            value += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte & 0x80);
+        values[i] = value;
+    }
+    return values;
+}
+
+const unzigzag = (v) => (v % 2 ? -(v + 1) / 2 : v / 2);
+const align4 = (n) => (n + 3) & ~3;
+const round = (v, decimals) => Math.round(v * 10 ** decimals) / 10 ** decimals;
+
+/**
+ * Decodes a binary frame into the same message object the JSON encoding
+ * produces, except that the visited node mask arrives as a sorted
+ * `visited_nodes` array (see visitedMask).
+ */
+export function decodeBinaryMessage(buffer) {
+    const bytes = new Uint8Array(buffer);
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...bytes.subarray(0, 4));
+    if (magic !== PATH_MAGIC) {
+        throw new Error(`Unknown binary message ${magic}`);
+    }
+
+    let offset = 4;
+    const headerLength = view.getUint32(offset, true);
+    offset += 4;
+    const message = JSON.parse(new TextDecoder().decode(bytes.subarray(offset, offset + headerLength)));
+    offset += align4(headerLength);
+
+    // Polyline: interleaved zigzag deltas of lng, lat
+    const pointCount = view.getUint32(offset, true);
+    const polylineLength = view.getUint32(offset + 4, true);
+    offset += 8;
+    const deltas = readVarints(bytes, offset, 2 * pointCount);
+    offset += align4(polylineLength);
+    const coordinates = new Array(pointCount);
+    let x = 0;
+    let y = 0;
+    for (let i = 0; i < pointCount; i++) {
+        x += unzigzag(deltas[2 * i]);
+        y += unzigzag(deltas[2 * i + 1]);
+        coordinates[i] = [x / COORD_SCALE, y / COORD_SCALE];
+    }
+
+    // Visited nodes: deltas of the sorted ids
+    const nodeCount = view.getUint32(offset, true);
+    const nodesLength = view.getUint32(offset + 4, true);
+    offset += 8;
+    const visitedNodes = readVarints(bytes, offset, nodeCount);
+    for (let i = 1; i < nodeCount; i++) {
+        visitedNodes[i] += visitedNodes[i - 1];
+    }
+    offset += align4(nodesLength);
+
+    // Profile columns: [dist_mi, elev_ft, lat, lng, bearing] per row
+    const rows = view.getUint32(offset, true);
+    offset += 4;
+    const dist = new Float32Array(buffer, offset, rows);
+    const elev = new Float32Array(buffer, offset + 4 * rows, rows);
+    const lat = new Int32Array(buffer, offset + 8 * rows, rows);
+    const lng = new Int32Array(buffer, offset + 12 * rows, rows);
+    const bearing = new Int16Array(buffer, offset + 16 * rows, rows);
+    const elevationProfile = new Array(rows);
+    for (let i = 0; i < rows; i++) {
+        elevationProfile[i] = [
+            round(dist[i], 3),
+            round(elev[i], 1),
+            lat[i] / COORD_SCALE,
+            lng[i] / COORD_SCALE,
+            bearing[i] / 10
+        ];
+    }
+
+    const path = message.path;
+    path.geometry = pointCount > 0 ? { type: 'LineString', coordinates } : null;
+    path.properties = {
+        ...path.properties,
+        visited_nodes: visitedNodes,
+        elevation_profile: elevationProfile
+    };
+    return message;
+}
+
+const maskCache = new WeakMap();
+
+/**
+ * A path's visited nodes as a BigInt bitmask, from the JSON `visited` hex
+ * string or, for binary paths, built once from `visited_nodes`.
+ */
+export function visitedMask(path) {
+    const props = path.properties || {};
+    const nodes = props.visited_nodes;
+    if (!nodes) {
+        return BigInt(props.visited || '0');
+    }
+    let mask = maskCache.get(nodes);
+    if (mask === undefined) {
+        // Set bits in 32-bit words, then convert once through a hex string
+        const words = new Uint32Array(nodes.length ? Math.floor(nodes[nodes.length - 1] / 32) + 1 : 1);
+        for (const node of nodes) {
+            words[node >>> 5] |= 1 << (node & 31);
+        }
+        let hex = '';
+        for (let i = words.length - 1; i >= 0; i--) {
+            hex += words[i].toString(16).padStart(8, '0');
+        }
+        mask = BigInt('0x' + hex);
+        maskCache.set(nodes, mask);
+    }
+    return mask;
+}
@@ -0,0 +1,88 @@
+import os
+import sys
+import glob
+import heapq
+import pickle
+import time
+import networkx as nx
+
+# Add backend to sys.path to allow importing its modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+from graph_snapshot import GraphSnapshot
+from search_queue import BucketQueue
+
+# Configuration
+MAX_POPS = 200000
+MAX_PATH_LENGTH = 16000  # meters
+
+
+def load_snapshot(path):
+    with open(path, 'rb') as f:
+        G = pickle.load(f)
+    if set(G.nodes) != set(range(len(G))):
+        G = nx.relabel_nodes(G, {old_id: new_id for new_id, old_id in enumerate(G.nodes)})
+    return GraphSnapshot.from_graph(G)
+
+
+def run_expansion(local, use_buckets):
+    """
+    Replays the loop search's expansion (turn/dist keys, no backtracking,
+    no loop emission) for MAX_POPS pops. Only the queue differs between runs.
+    Returns (pops, pushes, seconds).
+    """
+    offsets, targets, lengths, _, turn_offsets, turn_flags = local.adjacency()
+    pops = pushes = 0
+    t0 = time.perf_counter()
+
+    if use_buckets:
+        # BucketQueue orders integer handles; states live in a side list and
+        # the queue breaks distance ties by looking up state_dist/state_node
+        states = [(0, 0.0, 0, -1, -1, 0)]
+        state_dist, state_node = [0.0], [0]
+        queue = BucketQueue(state_dist, state_node)
+        queue.push(0, 0.0, 0)
+    else:
+        queue = [((0, 0.0, 0), (0, -1, -1), 0)]
+
+    while queue and pops < MAX_POPS:
+        if use_buckets:
+            turns, handle = queue.pop()
+            u, dist, _, prev_id, in_edge, mask = states[handle]
+        else:
+            (turns, dist, _), (u, prev_id, in_edge), mask = heapq.heappop(queue)
+        pops += 1
+        if (mask >> u) & 1:
+            continue
+        new_mask = mask | (1 << u)
+        turn_base = turn_offsets[in_edge] - offsets[u] if in_edge >= 0 else None
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            if v == prev_id:
+                continue
+            new_dist = dist + lengths[e]
+            if new_dist > MAX_PATH_LENGTH:
+                continue
+            new_turns = 0 if turn_base is None else turns + turn_flags[turn_base + e]
+            if use_buckets:
+                states.append((v, new_dist, new_turns, u, e, new_mask))
+                state_dist.append(new_dist)
+                state_node.append(v)
+                queue.push(new_turns, new_dist, len(states) - 1)
+            else:
+                heapq.heappush(queue, ((new_turns, new_dist, v), (v, u, e), new_mask))
+            pushes += 1
+
+    return pops, pushes, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(base_dir, 'graphs', '*.gpickle'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        snapshot = load_snapshot(path)
+        local = snapshot.extract_local(0, MAX_PATH_LENGTH / 2)
+
+        pops, pushes, heap_s = run_expansion(local, use_buckets=False)
+        _, _, bucket_s = run_expansion(local, use_buckets=True)
+        print(f"{name:28s} nodes={local.num_nodes:5d} pops={pops:7d} pushes={pushes:7d} "
+              f"heapq={heap_s:6.2f}s buckets={bucket_s:6.2f}s speedup={heap_s / bucket_s:4.2f}x")
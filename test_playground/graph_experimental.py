@@ -13,6 +13,7 @@ from shapely.geometry import Point, LineString, MultiLineString
 import sys
 # Add project root to sys.path to allow importing from backend
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
 from backend.loop_generator import weight_function_turns_dist, PathNode
 
 # Configuration